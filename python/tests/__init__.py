@@ -0,0 +1,28 @@
+"""Fixtures shared by the tests."""
+
+from twentysolver.agent import INF
+from twentysolver.agent.cachetree import ExpectFrame
+from twentysolver.benchmark import REFERENCE_GRIDS
+from twentysolver.grid import Grid
+from twentysolver.heuristic import estimate
+
+# the mid-game reference position, from which every move is legal
+MIDGAME = REFERENCE_GRIDS[2]
+
+def midgame_grid(grid_type=Grid):
+    """Returns the mid-game reference position as a grid of grid_type."""
+    return grid_type.from_list(MIDGAME)
+
+def expectiminimax(grid, turns, weights):
+    """Returns the value of grid searched exhaustively for turns player
+    moves, with the worst cell for a tile between each, and the moved
+    boards of the last turn estimated. A search to depth d by any of the
+    iterative engines searches d + 1 player moves."""
+    values = []
+    for _, g in grid.iter_available_moves():
+        if turns == 1:
+            values.append(estimate(g, weights))
+        else:
+            values.append(min(sum(p * expectiminimax(g.insert_tile(c, t), turns - 1, weights)
+                for t, p in ExpectFrame.moves) for c in g.get_available_cells()))
+    return max(values, default=-INF)
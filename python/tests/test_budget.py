@@ -0,0 +1,86 @@
+"""Test the Budget class."""
+
+import time
+import unittest
+
+from twentysolver.agent.budget import Budget, TimeManager
+from twentysolver.agent.cachetree import CacheTree
+from twentysolver.grid import Grid
+from tests import midgame_grid
+
+
+class TestBudget(unittest.TestCase):
+    def test_nodes(self):
+        """A node budget should run out on exactly its last node."""
+        budget = Budget(nodes=100, check_every=64)
+        self.assertFalse(any(budget.spend() for _ in range(99)))
+        self.assertTrue(budget.spend())
+        self.assertTrue(budget.over)
+        self.assertEqual(budget.finish()['node_overrun'], 0)
+        budget.start()
+        self.assertFalse(budget.over)
+
+    def test_wall(self):
+        budget = Budget(wall=1e6, check_every=1)
+        self.assertFalse(budget.spend())
+        time.sleep(.002)
+        self.assertTrue(budget.spend())
+        stats = budget.finish()
+        self.assertGreater(stats['wall_overrun'], 0)
+        self.assertEqual(stats['cpu_overrun'], 0)
+
+    def test_cpu(self):
+        budget = Budget(cpu=1e6, check_every=1)
+        while not budget.spend():
+            pass
+        self.assertGreaterEqual(budget.finish()['last_move_cpu_time'], 1e6)
+
+    def test_reproducible(self):
+        """Searches with the same node budget should search the same
+        nodes."""
+        grid = midgame_grid()
+        results = []
+        for _ in range(2):
+            agent = CacheTree(budget=Budget(nodes=2000))
+            move = agent.get_move(grid)
+            results.append((move, agent.stats['last_move_value'], agent.counts))
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(agent.stats['budget_nodes'], 2000)
+
+
+class TestTimeManager(unittest.TestCase):
+    def setUp(self):
+        self.open = Grid.from_list([2, 2] + [0] * 14)
+        self.crowded = Grid.from_list([
+            2, 4, 8, 16,
+            4, 8, 16, 32,
+            8, 16, 32, 64,
+            0, 32, 64, 128,
+            ])
+
+    def test_urgency(self):
+        self.assertGreater(TimeManager.urgency(self.crowded),
+                TimeManager.urgency(self.open))
+        self.assertEqual(TimeManager.urgency(Grid.from_list([
+            2, 4, 2, 0,
+            4, 2, 4, 0,
+            2, 4, 2, 0,
+            4, 2, 4, 0,
+            ])), 0)
+
+    def test_allocate(self):
+        """Budgets should follow urgency, and average out to the mean."""
+        manager = TimeManager()
+        budget = Budget(wall=2e8)
+        limits = [manager.allocate(grid, budget) for grid in (self.open, self.crowded)]
+        self.assertEqual(limits[0], 2e8)
+        self.assertGreater(limits[1], limits[0])
+        self.assertEqual(budget.wall, limits[1])
+        self.assertAlmostEqual(sum(limits) / 2, 2e8, delta=2e8 * .5)
+
+    def test_allowance(self):
+        manager = TimeManager(mean=2e8, allowance=1e9, share=.1)
+        budget = Budget()
+        self.assertEqual(manager.allocate(self.crowded, budget), 1e8)
+        manager.record({'last_move_time': 1e9})
+        self.assertEqual(manager.allocate(self.crowded, budget), manager.min_limit)
@@ -0,0 +1,137 @@
+"""Test the CacheLimitMin class."""
+
+import unittest
+
+from twentysolver import benchmark
+from twentysolver.agent import INF, search_bounds
+from twentysolver.agent.budget import Budget
+from twentysolver.agent.cachelimit import CacheLimitMin, MaxFrame, MinFrame
+from twentysolver.agent.sampling import CellSampling
+from twentysolver.agent.transposition import Entry, EXACT, LOWER, UPPER
+from tests import expectiminimax, midgame_grid
+
+
+class TestFrameBounds(unittest.TestCase):
+    def test_max_bound(self):
+        frame = MaxFrame(None, alpha=1, beta=3)
+        frame.window = frame.alpha, frame.beta
+        frame.update((2, None))
+        self.assertEqual(frame.bound(), EXACT)
+        frame.update((4, None))
+        self.assertEqual(frame.bound(), LOWER)
+        frame = MaxFrame(None, alpha=1, beta=3)
+        frame.window = frame.alpha, frame.beta
+        frame.update((0, None))
+        self.assertEqual(frame.bound(), UPPER)
+
+    def test_min_bound(self):
+        frame = MinFrame(None, alpha=1, beta=3)
+        frame.window = frame.alpha, frame.beta
+        frame.update((2, None))
+        self.assertEqual(frame.bound(), EXACT)
+        frame.update((0, None))
+        self.assertEqual(frame.bound(), UPPER)
+
+    def test_resolved_by(self):
+        frame = MinFrame(None, alpha=1, beta=3)
+        self.assertTrue(frame.resolved_by(Entry(2, 1, EXACT)))
+        self.assertTrue(frame.resolved_by(Entry(3, 1, LOWER)))
+        self.assertFalse(frame.resolved_by(Entry(2, 1, LOWER)))
+        self.assertTrue(frame.resolved_by(Entry(1, 1, UPPER)))
+        self.assertFalse(frame.resolved_by(Entry(2, 1, UPPER)))
+        self.assertFalse(frame.resolved_by(Entry(2, 1, None)))
+
+
+class TestCacheLimitMin(unittest.TestCase):
+    def test_cached_search(self):
+        """Searching again with a warm cache should give the same result
+        while returning cached results for some frames."""
+        grid = midgame_grid()
+        agent = CacheLimitMin(budget=Budget())
+        first = agent.search(grid, 2)
+        second = agent.search(grid, 2)
+        self.assertEqual(first, second)
+        self.assertGreater(agent.counts['cache_cutoffs'], 0)
+
+    def test_star1(self):
+        """Star1 should give the exhaustive value on every reference
+        position."""
+        for grid in benchmark.reference_grids():
+            for depth in (1, 2):
+                with self.subTest(grid=grid, depth=depth):
+                    value, _ = CacheLimitMin(budget=Budget()).search(grid, depth)
+                    self.assertAlmostEqual(value,
+                            expectiminimax(grid, depth + 1, CacheLimitMin.evaluate_weights))
+
+    def test_sampled_bounds(self):
+        """Frames above a sampled frame should only be cached as upper
+        bounds."""
+        grid = midgame_grid()
+        agent = CacheLimitMin(sampling=CellSampling(threshold=2, cells=1, sample=0),
+                budget=Budget())
+        agent.search(grid, 2)
+        self.assertGreater(agent.counts['sampled_frames'], 0)
+        self.assertIn(agent.cache.probe((grid, None)).bound, (UPPER, None))
+
+    def test_star1_first_outcome(self):
+        """Chance frames should be pruned by the bounds alone, before
+        their first outcome is searched, when no value can reach the
+        window."""
+        grid = midgame_grid()
+        agent = CacheLimitMin(budget=Budget())
+        _, high = search_bounds(grid, agent.evaluate_weights, 2)
+        agent.search(grid, 2, high + 1, INF)
+        self.assertEqual(agent.counts['get_max_calls'], 1)
+        self.assertGreater(agent.counts['cutoffs'], 0)
+
+    def test_own_cache(self):
+        """Each agent should keep its own cache and keying, whatever
+        agents are built after it."""
+        grid = midgame_grid()
+        agent = CacheLimitMin(cache_size=2**16, budget=Budget())
+        other = CacheLimitMin(cache_size=4, symmetric=True, budget=Budget())
+        agent.search(grid, 2)
+        self.assertEqual(agent.cache.evictions, 0)
+        self.assertGreater(len(agent.cache), 4)
+        self.assertEqual(len(other.cache), 0)
+        self.assertFalse(agent.symmetric)
+
+    def test_warm_search(self):
+        """A search with the table left by shallower searches should give
+        the same root value and move as a search with an empty table."""
+        def agent():
+            return CacheLimitMin(budget=Budget())
+        for grid in benchmark.reference_grids()[:3]:
+            with self.subTest(grid=grid):
+                cold = agent().search(grid, 3)
+                warm = agent()
+                for depth in (1, 2):
+                    warm.search(grid, depth)
+                value, move = warm.search(grid, 3)
+                self.assertAlmostEqual(value, cold[0])
+                self.assertEqual(move, cold[1])
+                self.assertGreater(warm.counts['cache_cutoffs'], 0)
+
+    def test_stats(self):
+        """A move should report its alpha-beta cutoffs alongside the cache
+        counters."""
+        agent = CacheLimitMin(budget=Budget(nodes=20000), ordering=True)
+        agent.get_move(midgame_grid())
+        self.assertGreater(agent.stats['cutoffs'], 0)
+        self.assertGreater(agent.stats['first_child_cutoff_rate'], 0)
+        self.assertLessEqual(agent.stats['first_child_cutoff_rate'], 1)
+        self.assertIn('cache_cutoffs', agent.stats)
+
+    def test_four_depth(self):
+        """Valuing 4 tiles statically should search fewer nodes, and leave
+        a search shallower than four_depth unchanged."""
+        grid = midgame_grid()
+        full = CacheLimitMin(budget=Budget())
+        result = full.search(grid, 2)
+        static = CacheLimitMin(four_depth=1, budget=Budget())
+        static.search(grid, 2)
+        self.assertGreater(static.counts['static_fours'], 0)
+        self.assertLess(static.budget.used, full.budget.used)
+        beyond = CacheLimitMin(four_depth=3, budget=Budget())
+        self.assertEqual(beyond.search(grid, 2), result)
+        self.assertEqual(beyond.counts['static_fours'], 0)
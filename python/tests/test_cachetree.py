@@ -2,8 +2,14 @@
 
 import unittest
 
+from twentysolver import benchmark
+from twentysolver.agent.budget import Budget
 from twentysolver.agent.cachetree import CacheTree, MaxFrame,\
         MinFrame, ExpectFrame, GridNode
+from twentysolver.agent.transposition import TranspositionTable
+from twentysolver.grid import Grid
+from tests import expectiminimax, midgame_grid
+
 
 class TestMaxFrame(unittest.TestCase):
     def test_gt(self):
@@ -28,3 +34,113 @@ class TestMaxFrame(unittest.TestCase):
 class TestCacheTreeAcceptance(unittest.TestCase):
     """CacheTree should search for its configured time limit, and return
     the optimum move (within searched space)."""
+
+
+class TestLeafBatching(unittest.TestCase):
+    def test_search_frontier(self):
+        """Batched leaves should give the same value and move as leaves
+        evaluated one at a time."""
+        grid = midgame_grid()
+        for depth in (1, 2):
+            nodes = []
+            for batch_leaves in (False, True):
+                agent = CacheTree(batch_leaves=batch_leaves, budget=Budget())
+                nodes.append(agent.search(GridNode(grid), depth))
+            self.assertEqual(nodes[0].move, nodes[1].move)
+            self.assertAlmostEqual(nodes[0].value, nodes[1].value)
+            self.assertGreater(agent.counts['batched_leaves'], 0)
+
+    def test_keeps_reused_tree(self):
+        """Batching the first iteration should keep the tree reused from
+        the last move."""
+        grid = midgame_grid()
+        agent = CacheTree(batch_leaves=True, budget=Budget())
+        agent.root = agent.search(GridNode(grid), 3)
+        cell = next(c for c in agent.root.children if c.children)
+        reply = next(n for n in cell.children if n.children)
+        root = agent.find_root(reply.grid)
+        self.assertGreater(agent.reused_nodes, 1)
+        agent.search(root, 1)
+        self.assertGreaterEqual(agent.trim(root), agent.reused_nodes)
+
+
+class TestStaticFours(unittest.TestCase):
+    def test_four_depth(self):
+        """Valuing 4 tiles statically should search fewer nodes, and stay
+        close to the full search."""
+        grid = midgame_grid()
+        agents = [CacheTree(budget=Budget()), CacheTree(four_depth=1, budget=Budget())]
+        nodes = []
+        for agent in agents:
+            nodes.append(agent.search(GridNode(grid), 2))
+        self.assertGreater(agents[1].counts['static_fours'], 0)
+        self.assertLess(agents[1].budget.used, agents[0].budget.used)
+        self.assertAlmostEqual(nodes[1].value / nodes[0].value, 1, places=1)
+        beyond = CacheTree(four_depth=3, budget=Budget())
+        node = beyond.search(GridNode(grid), 2)
+        self.assertEqual((node.move, node.value), (nodes[0].move, nodes[0].value))
+        self.assertEqual(beyond.counts['static_fours'], 0)
+
+
+class TestStar1(unittest.TestCase):
+    def test_search(self):
+        """Star1 should give the exhaustive value on every reference
+        position, and the same move as the default search, whose chance
+        pruning is only approximate."""
+        for grid in benchmark.reference_grids():
+            for depth in (1, 2):
+                with self.subTest(grid=grid, depth=depth):
+                    default, _ = benchmark.search(CacheTree(), grid, depth)
+                    star1, _ = benchmark.search(CacheTree(star1=True), grid, depth)
+                    self.assertEqual(star1.move, default.move)
+                    self.assertAlmostEqual(star1.value,
+                            expectiminimax(grid, depth + 1, CacheTree.evaluate_weights))
+
+
+class TestTable(unittest.TestCase):
+    def test_search(self):
+        """A Star1 search with the table left by a shallower search should
+        give the same value and move as a search without a table."""
+        for grid in benchmark.reference_grids()[:3]:
+            with self.subTest(grid=grid):
+                cold, _ = benchmark.search(CacheTree(star1=True), grid, 2)
+                agent = CacheTree(star1=True, table=TranspositionTable())
+                benchmark.search(agent, grid, 1)
+                warm, counts = benchmark.search(agent, grid, 2)
+                self.assertAlmostEqual(warm.value, cold.value)
+                self.assertEqual(warm.move, cold.move)
+                self.assertGreater(counts['table_cutoffs'], 0)
+
+
+class TestFindRoot(unittest.TestCase):
+    def setUp(self):
+        self.grid = midgame_grid()
+        self.agent = CacheTree(budget=Budget())
+        self.agent.root = self.agent.search(GridNode(self.grid), 2)
+
+    def test_reuse(self):
+        """The opponent's reply should be found by its board."""
+        moved = self.agent.root.grid
+        for cell in moved.get_available_cells():
+            for tile in (2, 4):
+                grid = moved.insert_tile(cell, tile)
+                node = self.agent.find_root(grid)
+                self.assertEqual(node.grid, grid)
+                if node.children is not None:
+                    self.assertGreater(self.agent.reused_nodes, 1)
+
+    def test_unrelated_grid(self):
+        grid = Grid.from_list([2] + [0] * 15)
+        node = self.agent.find_root(grid)
+        self.assertIsNone(node.children)
+        self.assertEqual(self.agent.reused_nodes, 0)
+
+    def test_trim(self):
+        """Trimmed trees should keep whole levels, within the cap."""
+        cell = next(c for c in self.agent.root.children if c.children)
+        node = next(n for n in cell.children if n.children)
+        size = self.agent.trim(node)
+        self.agent.max_retained = size - 1
+        kept = self.agent.trim(node)
+        self.assertLess(kept, size)
+        self.assertEqual(self.agent.trim(node), kept)
@@ -0,0 +1,53 @@
+"""Test the Expectimax agent."""
+
+import unittest
+
+from twentysolver.agent.budget import Budget
+from twentysolver.agent.expectimax import Expectimax
+from twentysolver.heuristic import estimate
+from tests import midgame_grid
+
+
+class TestExpectimax(unittest.TestCase):
+    def setUp(self):
+        self.grid = midgame_grid()
+        self.agent = Expectimax(budget=Budget())
+
+    def test_get_chance(self):
+        """A chance node should average its children over cells and tile
+        values."""
+        agent = self.agent
+        expected = 0
+        cells = self.grid.get_available_cells()
+        for cell in cells:
+            for tile, p in agent.tiles:
+                child = self.grid.insert_tile(cell, tile)
+                expected += p * max(estimate(g, agent.evaluate_weights)
+                        for _, g in child.get_available_moves()) / len(cells)
+        self.assertAlmostEqual(agent.get_chance(self.grid, 0, 1, 1), expected)
+
+    def test_prob_limit(self):
+        """Branches below the probability threshold should be estimated."""
+        agent = self.agent
+        agent.prob_limit = 1
+        self.assertEqual(agent.get_chance(self.grid, 0, .5, 3),
+                estimate(self.grid, agent.evaluate_weights))
+        self.assertEqual(agent.counts['get_max_calls'], 0)
+
+    def test_get_move(self):
+        agent = Expectimax()
+        move = agent.get_move(self.grid)
+        self.assertIn(move, [m for m, _ in self.grid.get_available_moves()])
+        self.assertGreaterEqual(agent.stats['last_move_value'], 1)
+
+    def test_depth_limit(self):
+        """Deepening should stop at depth_limit, and report the last depth
+        completed when the budget runs out first."""
+        for depth_limit in (1, 2):
+            agent = Expectimax(depth_limit=depth_limit, budget=Budget())
+            agent.get_move(self.grid)
+            self.assertEqual(agent.stats['last_move_value'], depth_limit)
+        # enough for depth 1, but not depth 2
+        agent = Expectimax(budget=Budget(nodes=1000))
+        agent.get_move(self.grid)
+        self.assertEqual(agent.stats['last_move_value'], 1)
@@ -1,8 +1,12 @@
 """Test the Grid class."""
 
 import unittest
+from unittest.mock import patch
 
-from twentysolver.grid import Grid
+import numpy as np
+
+from twentysolver.grid import Grid, BitGrid, transpose, move_row, row_table,\
+        move_batch, available_moves_batch, symmetries, transform_move, transform_cell
 
 DIRECTIONS = [RIGHT, DOWN, LEFT, UP] = range(4)
 
@@ -36,3 +40,169 @@ class TestGrid(unittest.TestCase):
             ],
             grid.move(DOWN).as_list())
 
+    def test_hash(self):
+        """Equal grids should hash equally, whether the hash was computed
+        from scratch or updated by insert_tile."""
+        grid = Grid.from_list([
+            2, 2, 0, 0,
+            0, 0, 0, 0,
+            4, 0, 0, 0,
+            8, 0, 0, 2,
+            ])
+        hash(grid)
+        inserted = grid.insert_tile((1, 1), 4).insert_tile((3, 0), 2)
+        fresh = Grid.from_list(inserted.as_list())
+        self.assertEqual(inserted, fresh)
+        self.assertEqual(hash(inserted), hash(fresh))
+        self.assertNotEqual(hash(grid), hash(inserted))
+        self.assertEqual({grid: 1, inserted: 2}[fresh], 2)
+
+
+class TestBitGrid(unittest.TestCase):
+    """BitGrid should behave identically to Grid."""
+    def setUp(self):
+        rng = np.random.default_rng(2048)
+        self.grids = [Grid.from_list(np.where(rng.random(16) < .4, 0,
+            2 ** rng.integers(1, 12, 16)))
+            for _ in range(200)]
+
+    def test_from_list(self):
+        for grid in self.grids:
+            bitgrid = BitGrid.from_list(grid.as_list())
+            self.assertEqual(grid.as_list(), bitgrid.as_list())
+            self.assertEqual(grid.get_max_tile(), bitgrid.get_max_tile())
+            self.assertEqual(grid.get_available_cells(), bitgrid.get_available_cells())
+            self.assertEqual(grid[1,2], bitgrid[1,2])
+            self.assertEqual(grid.get_cell_value(3,0), bitgrid.get_cell_value(3,0))
+
+    def test_move(self):
+        for grid in self.grids:
+            bitgrid = BitGrid.from_list(grid.as_list())
+            for direction in DIRECTIONS:
+                with self.subTest(grid=grid, direction=direction):
+                    self.assertEqual(grid.move(direction).as_list(),
+                            bitgrid.move(direction).as_list())
+
+    def test_available_moves(self):
+        for grid in self.grids:
+            bitgrid = BitGrid.from_list(grid.as_list())
+            self.assertEqual([m for m,_ in grid.get_available_moves()],
+                    [m for m,_ in bitgrid.get_available_moves()])
+
+    def test_move_mask(self):
+        for grid in self.grids:
+            bitgrid = BitGrid.from_list(grid.as_list())
+            expected = sum(1 << m for m in DIRECTIONS if grid.move(m) != grid)
+            self.assertEqual(expected, grid.get_move_mask())
+            self.assertEqual(expected, bitgrid.get_move_mask())
+
+    def test_iter_available_moves(self):
+        """Only the grids that are requested should be built."""
+        grid = Grid.from_list([
+            2, 0, 0, 0,
+            4, 0, 0, 0,
+            8, 0, 0, 0,
+            16, 0, 0, 0,
+            ])
+        moves = grid.iter_available_moves()
+        with patch.object(Grid, 'move', wraps=grid.move) as move:
+            self.assertEqual(next(moves)[0], RIGHT)
+            move.assert_called_once_with(RIGHT)
+        self.assertEqual(grid.get_move_mask(), 1 << RIGHT)
+        with self.assertRaises(Exception):
+            grid.validate_move(LEFT)
+
+    def test_insert_tile(self):
+        grid = BitGrid().insert_tile((1,2), 4).insert_tile((3,3), 2)
+        self.assertEqual(grid[1,2], 4)
+        self.assertEqual(grid[3,3], 2)
+        self.assertEqual(grid.get_available_cells().count((1,2)), 0)
+        self.assertEqual(len(grid.get_available_cells()), 14)
+
+    def test_symmetries(self):
+        """Moving a board and then transforming it should equal
+        transforming it and making the transformed move."""
+        for grid in self.grids[:50]:
+            bitgrid = BitGrid.from_list(grid.as_list())
+            for t, board in enumerate(symmetries(bitgrid.board)):
+                image = BitGrid(board)
+                for x, y in [(0, 0), (1, 3), (2, 1)]:
+                    self.assertEqual(bitgrid[x,y], image[transform_cell((x, y), t)])
+                    self.assertEqual((x, y),
+                            transform_cell(transform_cell((x, y), t), t, inverse=True))
+                for d in DIRECTIONS:
+                    self.assertEqual(symmetries(bitgrid.move(d).board)[t],
+                            image.move(transform_move(d, t)).board)
+                    self.assertEqual(d, transform_move(transform_move(d, t), t, inverse=True))
+
+    def test_canonical(self):
+        for grid in self.grids[:50]:
+            bitgrid = BitGrid.from_list(grid.as_list())
+            key, t = grid.canonical()
+            self.assertEqual((key, t), bitgrid.canonical())
+            self.assertEqual(key, symmetries(bitgrid.board)[t])
+            for board in symmetries(bitgrid.board):
+                self.assertEqual(key, BitGrid(board).canonical()[0])
+                self.assertEqual(key, Grid.from_list(BitGrid(board).as_list()).canonical()[0])
+
+    def test_transpose(self):
+        for grid in self.grids:
+            bitgrid = BitGrid.from_list(grid.as_list())
+            self.assertEqual(BitGrid(transpose(bitgrid.board)).as_list(),
+                    grid.tiles.reshape(4,4).T.flatten().tolist())
+
+
+class TestRowTable(unittest.TestCase):
+    def test_matches_move_row(self):
+        """Every row without a pair of 32768 tiles should slide exactly as
+        move_row does."""
+        table = row_table()
+        for row in range(0x10000):
+            exponents = [(row >> (4*i)) & 0xF for i in range(4)]
+            if exponents.count(15) > 1:
+                continue
+            tiles = [1 << e if e else 0 for e in exponents]
+            moved = move_row(list(tiles))
+            result = [(table.result[row] >> (4*i)) & 0xF for i in range(4)]
+            self.assertEqual(moved, [1 << e if e else 0 for e in result])
+            self.assertEqual(table.changed[row], moved != tiles)
+
+    def test_score(self):
+        table = row_table()
+        # [2, 2, 4, 4] -> [0, 0, 4, 8]
+        self.assertEqual(table.score[0x2211], 12)
+        # [2, 2, 2, 2] -> [0, 0, 4, 4]
+        self.assertEqual(table.score[0x1111], 8)
+        self.assertEqual(table.score[0x4321], 0)
+
+
+class TestMoveBatch(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(4096)
+        self.boards = np.where(rng.random((500, 16)) < .4, 0,
+                2 ** rng.integers(1, 12, (500, 16))).astype(np.uint16)
+
+    def test_move_batch(self):
+        """Batch moves should match move_row applied to each board."""
+        for direction in DIRECTIONS:
+            moved, valid = move_batch(self.boards, direction)
+            for board, result, v in zip(self.boards, moved, valid):
+                grid = np.array(board).reshape(4, 4)
+                if direction in (UP, DOWN):
+                    grid = grid.T
+                if direction in (LEFT, UP):
+                    grid = grid[:, ::-1]
+                expected = np.array([move_row(list(row)) for row in grid.tolist()])
+                if direction in (LEFT, UP):
+                    expected = expected[:, ::-1]
+                if direction in (UP, DOWN):
+                    expected = expected.T
+                self.assertEqual(expected.flatten().tolist(), result.tolist())
+                self.assertEqual(v, (result != board).any())
+
+    def test_available_moves_batch(self):
+        mask = available_moves_batch(self.boards)
+        self.assertEqual(mask.shape, (500, 4))
+        for board, moves in zip(self.boards, mask):
+            expected = [m for m,_ in Grid(board).get_available_moves()]
+            self.assertEqual(expected, [m for m in DIRECTIONS if moves[m]])
@@ -0,0 +1,117 @@
+"""Test the heuristic functions."""
+
+import unittest
+
+import numpy as np
+
+from twentysolver import heuristic
+from twentysolver.grid import Grid, BitGrid, DIRECTIONS
+
+WEIGHTS = [
+        (heuristic.evaluate_combination, .75),
+        (heuristic.evaluate_empty, 2),
+        (heuristic.evaluate_monotonic, .25),
+        ]
+
+def random_grids(n, seed=2048):
+    rng = np.random.default_rng(seed)
+    return [Grid.from_list(np.where(rng.random(16) < .4, 0,
+        2 ** rng.integers(1, 16, 16))) for _ in range(n)]
+
+
+class TestTileValue(unittest.TestCase):
+    def test_tile_value(self):
+        """tile_value should not depend on smaller tiles having been seen,
+        nor overflow the tile type."""
+        self.assertEqual(heuristic.tile_value(np.uint16(32768)), 14 * 32768)
+        self.assertEqual(heuristic.tile_value(8), 16)
+
+
+class TestLineFeatures(unittest.TestCase):
+    """Table-driven features should match the per-cell functions."""
+    def test_features(self):
+        for grid in random_grids(500):
+            bitgrid = BitGrid.from_list(grid.as_list())
+            with self.subTest(grid=grid):
+                self.assertEqual([f(grid) for f in heuristic.FEATURES],
+                        heuristic.line_feature_vector(grid.get_lines()).values)
+                self.assertEqual([f(grid) for f in heuristic.FEATURES],
+                        heuristic.line_feature_vector(bitgrid.get_lines()).values)
+
+    def test_estimate(self):
+        for grid in random_grids(200):
+            for weights in (WEIGHTS, [(heuristic.evaluate_max, 1)]):
+                self.assertEqual(sum(w * f(grid) for f, w in weights),
+                        heuristic.estimate(grid, weights))
+
+    def test_estimate_mixed(self):
+        """Features without a table should still be evaluated on the grid."""
+        grid = random_grids(1)[0]
+        weights = WEIGHTS + [(lambda g: 1, 3)]
+        self.assertEqual(sum(w * f(grid) for f, w in weights),
+                heuristic.estimate(grid, weights))
+
+
+class TestEstimateBatch(unittest.TestCase):
+    def test_estimate_batch(self):
+        grids = random_grids(300)
+        boards = np.array([grid.tiles for grid in grids])
+        for weights in (WEIGHTS, [(heuristic.evaluate_max, 1)]):
+            batch = heuristic.estimate_batch(boards, weights)
+            for grid, h in zip(grids, batch):
+                self.assertAlmostEqual(heuristic.estimate(grid, weights), h)
+
+    def test_batch_feature(self):
+        """Registered batch implementations should be used, and features
+        without one evaluated board by board."""
+        boards = np.array([grid.tiles for grid in random_grids(10)])
+        def corner(grid):
+            return grid[0, 0]
+        self.assertEqual(heuristic.estimate_batch(boards, [(corner, 1)]).tolist(),
+                boards[:, 0].tolist())
+        try:
+            heuristic.batch_feature(lambda boards, lines: 2 * boards[:, 0])(corner)
+            self.assertEqual(heuristic.estimate_batch(boards, [(corner, 1)]).tolist(),
+                    (2 * boards[:, 0]).tolist())
+        finally:
+            del heuristic.batch_features[corner]
+
+
+class TestFeatureVector(unittest.TestCase):
+    """Incrementally updated feature vectors should match vectors
+    computed from scratch."""
+    def test_line_feature_vector(self):
+        for grid in random_grids(100):
+            features = heuristic.features(grid)
+            self.assertIs(features, grid.features)
+            self.assertEqual(heuristic.estimate_vector(features, WEIGHTS),
+                    heuristic.estimate(grid, WEIGHTS))
+
+    def test_insert_feature_vector(self):
+        for grid in random_grids(100):
+            features = heuristic.line_feature_vector(grid.get_lines())
+            for cell in grid.get_available_cells()[:3]:
+                for tile in (2, 4):
+                    child = grid.insert_tile(cell, tile)
+                    self.assertEqual(heuristic.insert_feature_vector(features, cell, tile),
+                            heuristic.line_feature_vector(child.get_lines()))
+
+    def test_move_feature_vector(self):
+        for grid in random_grids(100):
+            features = heuristic.line_feature_vector(grid.get_lines())
+            for direction in DIRECTIONS:
+                child = grid.move(direction)
+                self.assertEqual(heuristic.move_feature_vector(features, direction),
+                        heuristic.line_feature_vector(child.get_lines()))
+
+
+class TestEstimateBounds(unittest.TestCase):
+    def test_estimate_bounds(self):
+        """Estimates of grids reachable within the given turns should fall
+        within the bounds."""
+        for grid in random_grids(20, seed=4):
+            low, high = heuristic.estimate_bounds(grid, WEIGHTS, 2)
+            for _, g in grid.iter_available_moves():
+                for cell in g.get_available_cells():
+                    child = g.insert_tile(cell, 4)
+                    self.assertTrue(low <= heuristic.estimate(child, WEIGHTS) <= high)
@@ -2,9 +2,13 @@
 
 import unittest
 
+from twentysolver import benchmark
+from twentysolver.agent import INF, aspiration_search
+from twentysolver.agent.budget import Budget
 from twentysolver.agent.newlimit import NewLimitMin, MaxFrame
 from twentysolver.grid import Grid
 from twentysolver.heuristic import estimate
+from tests import expectiminimax, midgame_grid
 
 class TestMaxFrame(unittest.TestCase):
     def test_init(self):
@@ -40,4 +44,66 @@ class TestMaxFrame(unittest.TestCase):
 
 
 class TestNewLimitMin(unittest.TestCase):
-    pass
+    def test_aspiration(self):
+        """A search within an aspiration window should choose the same
+        move as a search with a full window."""
+        grid = midgame_grid()
+        agent = NewLimitMin(budget=Budget())
+        guess, _ = agent.search(grid, 1)
+        full = agent.search(grid, 2)
+        counts = {}
+        result = aspiration_search(lambda alpha, beta: agent.search_value(grid, 2, alpha, beta),
+                guess, 1, counts=counts)
+        self.assertEqual(result, full)
+        self.assertGreater(sum(counts.values()), 0)
+
+    def test_late_move_reductions(self):
+        """Reducing late moves should search fewer nodes, and still find a
+        legal move."""
+        grid = midgame_grid()
+        nodes = []
+        for lmr in (None, 1):
+            agent = NewLimitMin(lmr=lmr, budget=Budget())
+            _, move = agent.search(grid, 3)
+            self.assertIn(move, [m for m, _ in grid.get_available_moves()])
+            nodes.append(agent.budget.used)
+        self.assertGreater(agent.counts['lmr_reductions'], 0)
+        self.assertLess(nodes[1], nodes[0])
+
+    def test_star1(self):
+        """Star1 should give the exhaustive value on every reference
+        position."""
+        for grid in benchmark.reference_grids():
+            for depth in (1, 2):
+                with self.subTest(grid=grid, depth=depth):
+                    value, _ = NewLimitMin(budget=Budget()).search(grid, depth)
+                    self.assertAlmostEqual(value,
+                            expectiminimax(grid, depth + 1, NewLimitMin.evaluate_weights))
+
+    def test_four_depth(self):
+        """Valuing 4 tiles statically should search fewer nodes, and leave
+        a search shallower than four_depth unchanged."""
+        grid = midgame_grid()
+        full = NewLimitMin(budget=Budget())
+        result = full.search(grid, 2)
+        static = NewLimitMin(four_depth=1, budget=Budget())
+        static.search(grid, 2)
+        self.assertGreater(static.counts['static_fours'], 0)
+        self.assertLess(static.budget.used, full.budget.used)
+        beyond = NewLimitMin(four_depth=3, budget=Budget())
+        self.assertEqual(beyond.search(grid, 2), result)
+        self.assertEqual(beyond.counts['static_fours'], 0)
+
+
+class TestAspirationSearch(unittest.TestCase):
+    def test_widen(self):
+        """Failing windows should widen on the failing side, then open."""
+        windows = []
+        def search(alpha, beta):
+            windows.append((alpha, beta))
+            return 100, 'result'
+        counts = {}
+        self.assertEqual(aspiration_search(search, 0, 1, widen=10, tries=2, counts=counts),
+                'result')
+        self.assertEqual(windows, [(-1, 1), (-1, 10), (-1, 100), (-1, INF)])
+        self.assertEqual(counts, {'aspiration_fail_low': 0, 'aspiration_fail_high': 3})
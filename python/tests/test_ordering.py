@@ -0,0 +1,45 @@
+"""Test the MoveOrdering class."""
+
+import unittest
+from types import SimpleNamespace
+
+from twentysolver.agent.ordering import MoveOrdering
+
+
+def children(*moves):
+    return [SimpleNamespace(move=m) for m in moves]
+
+
+class TestMoveOrdering(unittest.TestCase):
+    def test_order(self):
+        """Killers should come first, then moves by history, then the
+        given order."""
+        ordering = MoveOrdering()
+        ordering.record(1, (0, 0), depth=1)
+        ordering.record(4, (1, 1), depth=3)
+        ordering.record(4, (2, 2), depth=1)
+        queue = children((3, 3), (2, 2), (1, 1), (0, 0), (0, 1))
+        ordering.order(queue, 1)
+        self.assertEqual([c.move for c in queue],
+                [(0, 0), (1, 1), (2, 2), (3, 3), (0, 1)])
+
+    def test_player(self):
+        """Player moves should keep their order unless asked."""
+        queue = children(0, 1, 2)
+        ordering = MoveOrdering()
+        ordering.record(0, 2, depth=2)
+        ordering.order(queue, 0)
+        self.assertEqual([c.move for c in queue], [0, 1, 2])
+        ordering = MoveOrdering(player=True)
+        ordering.record(0, 2, depth=2)
+        ordering.order(queue, 0)
+        self.assertEqual([c.move for c in queue], [2, 0, 1])
+
+    def test_new_search(self):
+        ordering = MoveOrdering(killers=1)
+        ordering.record(1, (0, 0), depth=2)
+        ordering.record(1, (1, 1), depth=1)
+        self.assertEqual(ordering.killers[1], [(1, 1)])
+        ordering.new_search()
+        self.assertEqual(ordering.killers, {})
+        self.assertEqual(ordering.history, {(1, (0, 0)): 2})
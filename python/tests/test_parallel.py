@@ -0,0 +1,87 @@
+"""Test the ParallelCacheTree agent."""
+
+import time
+import unittest
+
+from twentysolver.agent import parallel
+from twentysolver.agent.parallel import ParallelCacheTree, search_unit
+from twentysolver.agent.transposition import SharedTranspositionTable, TranspositionTable
+from tests import midgame_grid
+
+def tearDownModule():
+    parallel.shutdown_pool()
+
+
+class TestParallelCacheTree(unittest.TestCase):
+    def setUp(self):
+        self.grid = midgame_grid()
+
+    def test_merge_chance(self):
+        """A move should be worth its worst cell, and a cell the expected
+        value of its tiles."""
+        agent = ParallelCacheTree(processes=2, split='chance')
+        agent.cells = [2, 1]
+        values = [10, 0, 20, 20, 15, 15]
+        self.assertEqual(agent.merge([0, 1], values), 1)
+
+    def test_units_match_search(self):
+        """Searching the chance units one turn shallower should give the
+        same move as searching the root."""
+        agent = ParallelCacheTree(processes=2, split='chance')
+        moves = [m for m, _ in self.grid.iter_available_moves()]
+        deadline = time.time() + 60
+        values = [search_unit((0, g, m, 2 - offset, deadline, agent.config))[0]
+                for g, m, offset in agent.units(self.grid, moves)]
+        root = [search_unit((1, self.grid, m, 2, deadline, agent.config))[0] for m in moves]
+        self.assertEqual(agent.merge(moves, values), moves[root.index(max(root))])
+
+    def test_get_move(self):
+        """Agents should share one pool, and return a legal move."""
+        agents = [ParallelCacheTree(processes=2, split=split)
+                for split in ('moves', 'chance')]
+        pool = parallel.get_pool(2)
+        for agent in agents:
+            move = agent.get_move(self.grid)
+            self.assertIn(move, [m for m, _ in self.grid.get_available_moves()])
+            self.assertIs(parallel.get_pool(2), pool)
+
+    def test_table(self):
+        """Units should share values through the agent's table, and give
+        the same result with it."""
+        table = SharedTranspositionTable(2**14)
+        try:
+            agent = ParallelCacheTree(processes=2, star1=True, table=table)
+            plain = ParallelCacheTree(processes=2, star1=True)
+            deadline = time.time() + 60
+            cold, _ = search_unit((0, self.grid, None, 2, deadline, plain.config))
+            search_unit((1, self.grid, None, 1, deadline, agent.config))
+            warm, counts = search_unit((2, self.grid, None, 2, deadline, agent.config))
+            self.assertAlmostEqual(warm, cold)
+            self.assertGreater(counts['table_cutoffs'], 0)
+            self.assertGreater(len(table), 0)
+            with self.assertRaises(ValueError):
+                ParallelCacheTree(processes=2, table=TranspositionTable())
+        finally:
+            table.close()
+            table.unlink()
+
+    def test_pools(self):
+        """Agents with different numbers of processes should each keep
+        their own pool."""
+        pool = parallel.get_pool(2)
+        ParallelCacheTree(processes=1)
+        self.assertIs(parallel.get_pool(2), pool)
+        self.assertIsNot(parallel.get_pool(1), pool)
+
+    def test_options(self):
+        """Workers should search with the agent's options, and reject the
+        ones they cannot honour."""
+        deadline = time.time() + 60
+        for lmr, reduced in ((None, False), (1, True)):
+            agent = ParallelCacheTree(processes=2, lmr=lmr, lmr_depth=1)
+            _, counts = search_unit((0, self.grid, None, 2, deadline, agent.config))
+            self.assertEqual(counts['lmr_reductions'] > 0, reduced)
+        for option in ({'aspiration': .1}, {'max_retained': 10}):
+            with self.subTest(option=option):
+                with self.assertRaises(ValueError):
+                    ParallelCacheTree(processes=2, **option)
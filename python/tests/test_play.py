@@ -0,0 +1,49 @@
+"""Test playing series of games."""
+
+import unittest
+
+from twentysolver.agent import CacheTree, IterativeSearch
+from twentysolver.play import play_series
+from twentysolver.player_agent import PlayerAITreeLimitMin
+
+
+class QuitDisplayer:
+    """Displayer that ignores what it is shown, and quits after moves
+    moves."""
+    def __init__(self, moves):
+        self.moves = moves
+
+    def getch(self):
+        self.moves -= 1
+        return ord('q') if self.moves < 0 else -1
+
+    def __getattr__(self, name):
+        return lambda *args: None
+
+
+class FastCacheTree(CacheTree):
+    """CacheTree with a short limit, which keeps the agents it makes."""
+    players = []
+
+    def __init__(self, **kwargs):
+        super().__init__(time_limit=1e7, **kwargs)
+        self.players.append(self)
+
+
+class TestPlaySeries(unittest.TestCase):
+    def test_adaptive_time(self):
+        """Every game should get a time manager, which sets the limit of
+        each move."""
+        FastCacheTree.players.clear()
+        play_series(QuitDisplayer(3), agent=FastCacheTree, adaptive_time=True)
+        player, = FastCacheTree.players
+        self.assertIsNotNone(player.time_manager)
+        self.assertEqual(player.time_manager.moves, 3)
+        self.assertGreater(player.time_manager.spent, 0)
+
+    def test_adaptive_time_unsupported(self):
+        """Agents that ignore budgets should be refused adaptive time."""
+        for agent in (PlayerAITreeLimitMin, IterativeSearch):
+            with self.subTest(agent=agent):
+                with self.assertRaisesRegex(ValueError, agent.__name__):
+                    play_series(QuitDisplayer(3), agent=agent, adaptive_time=True)
@@ -0,0 +1,68 @@
+"""Test the CellSampling class."""
+
+import unittest
+
+from twentysolver.agent.budget import Budget
+from twentysolver.agent.cachelimit import CacheLimitMin
+from twentysolver.agent.cachetree import CacheTree, GridNode
+from twentysolver.agent.newlimit import NewLimitMin
+from twentysolver.agent.sampling import CellSampling
+from twentysolver.grid import Grid
+
+
+OPENING = Grid.from_list([
+    0, 0, 0, 0,
+    0, 0, 0, 0,
+    0, 0, 0, 2,
+    2, 0, 4, 8,
+    ])
+
+
+class TestCellSampling(unittest.TestCase):
+    def test_select(self):
+        """Wide frames should search the ranked cells, then the sample,
+        and narrow frames every cell."""
+        sampling = CellSampling(threshold=4, cells=2, sample=1, seed=0)
+        children = list(range(6))
+        self.assertEqual(sampling.select(children), 3)
+        self.assertEqual(children[:2], [0, 1])
+        self.assertEqual(sorted(children), list(range(6)))
+        self.assertIsNone(sampling.select(list(range(4))))
+
+    def test_unrepresentative(self):
+        """Only a sampled cell that lowers the value should re-search."""
+        sampling = CellSampling(cells=2)
+        self.assertFalse(sampling.unrepresentative(1, True))
+        self.assertFalse(sampling.unrepresentative(2, False))
+        self.assertTrue(sampling.unrepresentative(2, True))
+
+    def test_search(self):
+        """Sampling should search fewer nodes, and still find a legal
+        move."""
+        grid = OPENING
+        nodes = []
+        for sampling in (None, CellSampling(seed=0)):
+            agent = NewLimitMin(sampling=sampling, budget=Budget())
+            _, move = agent.search(grid, 2)
+            self.assertIn(move, [m for m, _ in grid.get_available_moves()])
+            nodes.append(agent.budget.used)
+        self.assertGreater(agent.counts['sampled_frames'], 0)
+        self.assertLess(nodes[1], nodes[0])
+
+    def search_researches(self, agent_type, root):
+        """Searches root with a sample that often misses dangerous cells,
+        and checks that the frames it misled were searched in full."""
+        sampling = CellSampling(threshold=4, cells=2, sample=2, seed=0)
+        agent = agent_type(sampling=sampling, budget=Budget())
+        agent.search(root, 2)
+        self.assertGreater(agent.counts['sampled_frames'], 0)
+        self.assertGreater(agent.counts['sample_researches'], 0)
+
+    def test_researches_newlimit(self):
+        self.search_researches(NewLimitMin, OPENING)
+
+    def test_researches_cachelimit(self):
+        self.search_researches(CacheLimitMin, OPENING)
+
+    def test_researches_cachetree(self):
+        self.search_researches(CacheTree, GridNode(OPENING))
@@ -0,0 +1,178 @@
+"""Test the TranspositionTable class."""
+
+import multiprocessing
+import unittest
+
+from twentysolver import benchmark
+from twentysolver.agent import INF
+from twentysolver.agent.transposition import TranspositionTable,\
+        SharedTranspositionTable, Entry, EXACT, LOWER, packed_key
+from twentysolver.grid import BitGrid
+
+
+class Key(int):
+    """Integer key with a chosen hash, to force collisions."""
+    def __new__(cls, value, h):
+        key = super().__new__(cls, value)
+        key.h = h
+        return key
+
+    def __hash__(self):
+        return self.h
+
+
+class TestTranspositionTable(unittest.TestCase):
+    def test_get_store(self):
+        table = TranspositionTable(16)
+        self.assertIsNone(table.get('a'))
+        table.store('a', 1)
+        table.store('a', 2)
+        self.assertEqual(table.get('a'), 2)
+        self.assertEqual(len(table), 1)
+        self.assertEqual(table.counters(),
+                {'cache_hits': 1, 'cache_misses': 1, 'cache_evictions': 0})
+        self.assertEqual(table.counters()['cache_hits'], 0)
+
+    def test_capacity(self):
+        """The table should never hold more than its capacity."""
+        table = TranspositionTable(64)
+        for i in range(1000):
+            table.store(i, i)
+        self.assertLessEqual(len(table), 64)
+        self.assertGreater(table.evictions, 0)
+
+    def test_depth_preferred(self):
+        """A deep entry should survive shallower entries in its bucket
+        during the same search, but not into the next search."""
+        table = TranspositionTable(2)
+        table.store(Key(1, 0), 'deep', depth=5)
+        table.store(Key(2, 0), 'shallow', depth=1)
+        table.store(Key(3, 0), 'shallower', depth=1)
+        self.assertEqual(table.get(Key(1, 0)), 'deep')
+        self.assertIsNone(table.get(Key(2, 0)))
+        self.assertEqual(table.get(Key(3, 0)), 'shallower')
+        table.new_search()
+        table.store(Key(4, 0), 'new', depth=1)
+        self.assertEqual(table.get(Key(4, 0)), 'new')
+        self.assertEqual(table.get(Key(1, 0)), 'deep')
+        table.store(Key(5, 0), 'newer', depth=1)
+        self.assertIsNone(table.get(Key(1, 0)))
+
+
+def store_entries(table, keys):
+    for key in keys:
+        table.store(key, key / 2, depth=key % 7, bound=key % 3)
+    table.close()
+
+
+def agent_keys():
+    """Returns keys as the agents make them: grids and canonical boards,
+    with no move, a direction or a cell. A Grid and a BitGrid of the same
+    board make the same key."""
+    keys = []
+    for grid in benchmark.reference_grids()[:3]:
+        moves = [None, *(m for m, _ in grid.iter_available_moves()),
+                *grid.get_available_cells()]
+        for board in (grid, BitGrid(grid.board), grid.canonical()[0]):
+            keys.extend((board, move) for move in moves)
+    return keys
+
+
+def store_agent_keys(table):
+    for i, key in enumerate(agent_keys()):
+        table.store(key, i, depth=1)
+    table.close()
+
+
+class TestSharedTranspositionTable(unittest.TestCase):
+    def setUp(self):
+        self.table = SharedTranspositionTable(1024)
+
+    def tearDown(self):
+        self.table.close()
+        self.table.unlink()
+
+    def test_get_store(self):
+        table = self.table
+        self.assertIsNone(table.get(1))
+        table.store(1, 1.5, depth=3, bound=LOWER)
+        table.store(2, -INF, bound=None)
+        self.assertEqual(table.probe(1), Entry(1.5, 3, LOWER))
+        self.assertEqual(table.probe(2), Entry(-INF, 0, None))
+        self.assertEqual(len(table), 2)
+        table.clear()
+        self.assertEqual(len(table), 0)
+
+    def test_depth_preferred(self):
+        """Shared tables should replace entries as TranspositionTable
+        does. Every key falls in the one bucket."""
+        table = SharedTranspositionTable(2)
+        try:
+            table.store(1, 1, depth=5)
+            table.store(2, 2, depth=1)
+            table.store(3, 3, depth=1)
+            self.assertEqual(table.get(1), 1)
+            self.assertIsNone(table.get(2))
+            table.new_search()
+            table.store(4, 4, depth=1)
+            table.store(5, 5, depth=1)
+            self.assertIsNone(table.get(1))
+        finally:
+            table.close()
+            table.unlink()
+
+    def test_torn_record(self):
+        """A record whose words do not match its check should read as a
+        miss."""
+        self.table.store(1, 1.5)
+        i = self.table.find(1)
+        self.table.slots[i, 1] ^= 1
+        self.assertIsNone(self.table.get(1))
+
+    def test_processes(self):
+        """Entries stored by other processes should be visible."""
+        workers = [multiprocessing.Process(target=store_entries,
+            args=(self.table, range(i, 200, 2))) for i in range(2)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        found = [self.table.probe(key) for key in range(200)]
+        self.assertGreater(sum(entry is not None for entry in found), 100)
+        for key, entry in enumerate(found):
+            if entry is not None:
+                self.assertEqual(entry, Entry(key / 2, key % 7, key % 3))
+
+    def test_exact_keys(self):
+        """Keys sharing a bucket should never read as each other."""
+        table = SharedTranspositionTable(2)
+        try:
+            grid = benchmark.reference_grids()[2]
+            table.store((grid, None), 1)
+            self.assertIsNone(table.get((grid, 0)))
+            self.assertIsNone(table.get((BitGrid(grid.board + 1), None)))
+            self.assertEqual(table.get((BitGrid(grid.board), None)), 1)
+        finally:
+            table.close()
+            table.unlink()
+
+    def test_spawn(self):
+        """Agent keys stored by a spawned process, whose hashes of None
+        and of tuples may differ from this one's, should be found."""
+        table = SharedTranspositionTable(2**12)
+        try:
+            context = multiprocessing.get_context('spawn')
+            worker = context.Process(target=store_agent_keys, args=(table,))
+            worker.start()
+            worker.join()
+            self.assertEqual(worker.exitcode, 0)
+            stored = {packed_key(key): i for i, key in enumerate(agent_keys())}
+            found = {key: table.probe(key) for key in agent_keys()}
+            self.assertGreater(sum(entry is not None for entry in found.values()),
+                    len(stored) // 2)
+            for key, entry in found.items():
+                if entry is not None:
+                    self.assertEqual(entry, Entry(stored[packed_key(key)], 1, EXACT))
+        finally:
+            table.close()
+            table.unlink()
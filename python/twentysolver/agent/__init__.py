@@ -7,6 +7,10 @@ import statistics
 import twentysolver.heuristic as heuristic
 from twentysolver.heuristic import estimate, estimate_min
 
+from .budget import Budget
+from .ordering import MoveOrdering
+from .sampling import CellSampling
+
 INF = 2**31 - 1
 
 def record(func):
@@ -36,15 +40,111 @@ def count(func):
         return func(self, *args, **kwargs)
     return wrapper
 
+def star1_window(alpha, beta, value, prob_left, prob, bounds):
+    """Returns the (alpha, beta) window for the next child of a chance
+    node under Star1 pruning. value is the probability-weighted sum of
+    the children searched so far, prob_left the total probability of the
+    children not yet searched, prob the probability of the next child,
+    and bounds the (low, high) range of any value in the search."""
+    low, high = bounds
+    rest = prob_left - prob
+    return (alpha - value - high * rest) / prob, (beta - value - low * rest) / prob
+
+def star1_cutoff(alpha, beta, value, prob_left, bounds):
+    """Returns the bound to give a chance node that can be pruned under
+    Star1, or None. A node is pruned if, even with every remaining child
+    at the highest (or lowest) possible value, its expected value would
+    not be above alpha (or below beta); that expected value is then an
+    upper (or lower) bound on its value."""
+    low, high = bounds
+    if value + high * prob_left <= alpha:
+        return value + high * prob_left
+    if value + low * prob_left >= beta:
+        return value + low * prob_left
+    return None
+
+def search_bounds(grid, weights, depth_limit):
+    """Returns the (low, high) range of values a search of depth_limit
+    turns from grid can return. Lost games score -INF, but a game cannot
+    be lost while empty cells remain, and each turn fills at most one."""
+    low, high = heuristic.estimate_bounds(grid, weights, depth_limit)
+    if len(grid.get_available_cells()) <= depth_limit:
+        low = -INF
+    return low, high
+
+def static_max(grid, weights):
+    """Returns the estimate of the best move from grid, the value a
+    search from grid with one turn left would give, without searching it.
+    A grid with no moves is a lost game, and scores -INF."""
+    return max((estimate(g, weights) for _, g in grid.iter_available_moves()),
+            default=-INF)
+
+def aspiration_search(search, guess, delta, widen=4, tries=2, counts=None):
+    """Calls search(alpha, beta), which returns (value, result), with a
+    window of delta either side of guess. While the value falls on or
+    outside the window, the failing side is widened by a factor of widen
+    and searched again, until after tries widenings that side is opened
+    fully. Re-searches are counted in counts, if given, as
+    aspiration_fail_low and aspiration_fail_high. Returns the last
+    result; if value is None, the search was abandoned and its result is
+    returned as is."""
+    low = high = delta
+    fails = {'aspiration_fail_low': 0, 'aspiration_fail_high': 0}
+    while True:
+        alpha = guess - low if low is not None else -INF
+        beta = guess + high if high is not None else INF
+        value, result = search(alpha, beta)
+        if value is None:
+            break
+        if value <= alpha and alpha > -INF:
+            fails['aspiration_fail_low'] += 1
+            low = low * widen if fails['aspiration_fail_low'] <= tries else None
+        elif value >= beta and beta < INF:
+            fails['aspiration_fail_high'] += 1
+            high = high * widen if fails['aspiration_fail_high'] <= tries else None
+        else:
+            break
+    if counts is not None:
+        for key, n in fails.items():
+            counts[key] = counts.get(key, 0) + n
+    return result
+
 class PlayerAI:
     evaluate_weights = [
             (heuristic.evaluate_max, 1),
             ]
+    # counters kept by the search, zeroed by reset_counts
+    count_keys = ('get_max_calls',)
+    # whether get_move searches to self.budget, so that a time manager
+    # can set its limit
+    uses_budget = False
 
-    def __init__(self, depth_limit=3, move_limit=INF):
+    def __init__(self, depth_limit=3, move_limit=INF, time_manager=None):
         self.depth_limit = depth_limit
         self.move_limit = move_limit
+        self.time_manager = time_manager
         self.stats = {}
+        self.reset_counts()
+
+    def reset_counts(self):
+        """Sets every counter kept by the search to zero, as at the start
+        of every move."""
+        self.counts = dict.fromkeys(self.count_keys, 0)
+
+    def start_budget(self, grid):
+        """Starts the agent's budget for a move from grid, letting the
+        time manager, if any, set its limit first."""
+        if self.time_manager is not None:
+            self.time_manager.allocate(grid, self.budget)
+        self.budget.start()
+
+    def finish_budget(self):
+        """Finishes the agent's budget for a move, and returns its
+        statistics."""
+        stats = self.budget.finish()
+        if self.time_manager is not None:
+            self.time_manager.record(stats)
+        return stats
 
     @record
     def get_move(self, grid):
@@ -53,10 +153,9 @@ class PlayerAI:
     def get_max(self, grid, depth=0, **kwargs):
         if depth == self.depth_limit:
             return heuristic.estimate(grid, self.evaluate_weights), None
-        moves = grid.get_available_moves()
         val = -INF
         move = None
-        for m, g in moves:
+        for m, g in grid.iter_available_moves():
             v = self.get_min(g, depth)
             if v > val:
                 val = v
@@ -73,6 +172,151 @@ class PlayerAI:
                 val = v
         return val
 
+
+class IterativeSearch(PlayerAI):
+    """Options and counters shared by the iterative deepening engines.
+
+    The engines differ only in how they step through their frames; each
+    calls the methods below at the points where an option applies."""
+    count_keys = ('get_max_calls', 'cutoffs', 'first_child_cutoffs',
+            'aspiration_fail_low', 'aspiration_fail_high', 'lmr_reductions',
+            'lmr_researches', 'sampled_frames', 'sample_researches', 'static_fours')
+
+    def __init__(self, depth_limit=2, time_limit=2e8, budget=None, ordering=False,
+            aspiration=None, aspiration_widen=4, lmr=None, lmr_depth=2, sampling=None,
+            four_depth=None, **kwargs):
+        self.budget = budget if budget is not None else Budget(wall=time_limit)
+        # ordering may be True, or a configured MoveOrdering
+        if ordering is True:
+            ordering = MoveOrdering()
+        self.ordering = ordering or None
+        # half-width of the aspiration window, as a fraction of the last
+        # iteration's value, or None to search every iteration with a
+        # full window
+        self.aspiration = aspiration
+        self.aspiration_widen = aspiration_widen
+        # late-move reductions: player moves ranked lmr or lower (from 0)
+        # are searched a turn shallower from frames with at least
+        # lmr_depth turns left, or None to search every move fully
+        self.lmr = lmr
+        self.lmr_depth = lmr_depth
+        # sampling may be True, or a configured CellSampling
+        if sampling is True:
+            sampling = CellSampling()
+        self.sampling = sampling or None
+        # outcomes after the first, the 4 tiles, placed four_depth or
+        # more turns below the root are valued by static_max instead of
+        # searched, or None to search every outcome
+        self.four_depth = four_depth
+        super().__init__(depth_limit, **kwargs)
+
+    def new_move(self):
+        """Resets the counters and ages the move ordering, at the start of
+        a move."""
+        self.reset_counts()
+        if self.ordering is not None:
+            self.ordering.new_search()
+
+    def search_iteration(self, root, depth_limit, guess):
+        """Searches root to depth_limit, within an aspiration window
+        around guess, the value of the last iteration, if aspiration is
+        set and guess is known. Returns the result of search."""
+        if self.aspiration is None or guess is None or abs(guess) >= INF:
+            return self.search(root, depth_limit)
+        return aspiration_search(
+                lambda alpha, beta: self.search_value(root, depth_limit, alpha, beta),
+                guess, self.aspiration * max(1, abs(guess)), self.aspiration_widen,
+                counts=self.counts)
+
+    def search_value(self, grid, depth_limit, alpha, beta):
+        """Searches grid within (alpha, beta), returning the value and the
+        (value, move) result of search, or None for the value if the
+        budget ran out."""
+        result = self.search(grid, depth_limit, alpha, beta)
+        if self.budget.over:
+            return None, result
+        return result[0], result
+
+    def search_stats(self):
+        """Returns the statistics of the options over the last move."""
+        return {
+                'aspiration_researches': (self.counts['aspiration_fail_low']
+                    + self.counts['aspiration_fail_high']),
+                'lmr_reductions': self.counts['lmr_reductions'],
+                'lmr_researches': self.counts['lmr_researches'],
+                'sampled_frames': self.counts['sampled_frames'],
+                'sample_researches': self.counts['sample_researches'],
+                'static_fours': self.counts['static_fours'],
+                }
+
+    def count_cutoff(self, frame, ply, depth):
+        """Counts a cutoff by the last child searched from frame, and
+        records it for move ordering."""
+        self.counts['cutoffs'] += 1
+        if frame.i == 0:
+            # pruned before any child was searched
+            return
+        if frame.i == 1:
+            self.counts['first_child_cutoffs'] += 1
+        if self.ordering is not None:
+            self.ordering.record(ply, frame.queue[frame.i - 1].move, depth)
+
+    def ordering_stats(self):
+        """Returns the cutoff counts of the last move, and the share of
+        cutoffs made by the first child searched."""
+        cutoffs = self.counts['cutoffs']
+        return {
+                'cutoffs': cutoffs,
+                'first_child_cutoff_rate': (self.counts['first_child_cutoffs'] / cutoffs
+                    if cutoffs else 0),
+                }
+
+    def reduce(self, frame, child, depth):
+        """Marks child, the current child of the player frame frame with
+        depth turns left, to be searched a turn shallower if it is a late
+        move."""
+        if self.lmr is not None and frame.i >= self.lmr and depth >= self.lmr_depth:
+            child.reduced += 1
+            frame.reducing = True
+            self.counts['lmr_reductions'] += 1
+
+    def research(self, frame, value):
+        """Returns True if the current child of frame, just searched to
+        value, was reduced and must be searched again at full depth
+        because it beat the best move so far."""
+        if not frame.reducing:
+            return False
+        frame.reducing = False
+        if value > frame.alpha:
+            self.counts['lmr_researches'] += 1
+            return True
+        return False
+
+    def select_cells(self, frame, children):
+        """Limits the opponent frame frame to the cells of children that
+        sampling chooses, if it is wide enough to sample."""
+        if self.sampling is None:
+            return
+        frame.limit = self.sampling.select(children)
+        if frame.limit is not None:
+            self.counts['sampled_frames'] += 1
+
+    def extend_cells(self, frame, improved):
+        """Lets a sampled opponent frame search every cell if its current
+        child, which improved on its value or not, shows the sample to be
+        unrepresentative."""
+        if frame.limit is not None and self.sampling.unrepresentative(frame.i, improved):
+            frame.limit = None
+            self.counts['sample_researches'] += 1
+
+    def static_four(self, frame, turn):
+        """Returns True if the current outcome of the chance frame frame,
+        turn turns below the root, is valued statically."""
+        if self.four_depth is None or frame.i == 0 or turn < self.four_depth:
+            return False
+        self.counts['static_fours'] += 1
+        return True
+
 class Node:
     __slots__ = [
             'move',
@@ -99,3 +343,5 @@ from .treelimit import PlayerAITreeLimitMin
 from .newlimit import NewLimitMin
 from .cachelimit import CacheLimitMin
 from .cachetree import CacheTree
+from .expectimax import Expectimax
+from .parallel import ParallelCacheTree
@@ -0,0 +1,160 @@
+"""Search budgets: how long, or how many nodes, an agent may search for
+a move."""
+
+import time
+
+
+class Budget:
+    """Limits a search by wall-clock time, CPU time and node count, in
+    any combination. Times are in nanoseconds, as elsewhere in the agents;
+    a limit of None is unlimited.
+
+    Call start at the beginning of every move, then spend once for every
+    node searched; spend returns True once any limit is reached, and over
+    stays True until the next start. Nodes are counted exactly, so a node
+    budget stops every search at the same point. The clocks are only read
+    every check_every nodes, so a time budget may overrun by that many
+    nodes. Call finish at the end of the move to record its elapsed times
+    and how far they overran their limits."""
+
+    def __init__(self, wall=None, cpu=None, nodes=None, check_every=64):
+        self.wall = wall
+        self.cpu = cpu
+        self.nodes = nodes
+        self.check_every = check_every
+        self.start()
+
+    def start(self):
+        """Starts the budget for a new move."""
+        self.over = False
+        self.used = 0
+        self.wall_start = time.monotonic_ns()
+        self.cpu_start = time.process_time_ns()
+        self.next_check = self._next_check()
+        self.stats = {}
+
+    @property
+    def deadline(self):
+        """Returns the wall-clock deadline, in seconds since the epoch, or
+        None if there is no wall-clock limit."""
+        if self.wall is None:
+            return None
+        return time.time() + (self.wall_start + self.wall - time.monotonic_ns()) / 1e9
+
+    def _next_check(self):
+        check = self.used + self.check_every
+        if self.nodes is not None:
+            check = min(check, self.nodes)
+        return check
+
+    def spend(self, nodes=1):
+        """Counts nodes searched, and returns True if the budget is
+        spent."""
+        self.used += nodes
+        if self.used >= self.next_check:
+            self.check()
+        return self.over
+
+    def check(self):
+        """Reads the clocks, and returns True if the budget is spent."""
+        if (self.nodes is not None and self.used >= self.nodes
+                or self.wall is not None
+                    and time.monotonic_ns() - self.wall_start >= self.wall
+                or self.cpu is not None
+                    and time.process_time_ns() - self.cpu_start >= self.cpu):
+            self.over = True
+        self.next_check = self._next_check()
+        return self.over
+
+    def finish(self):
+        """Records and returns the statistics of the move: elapsed wall
+        and CPU time, nodes searched, and how far each exceeded its
+        limit."""
+        wall = time.monotonic_ns() - self.wall_start
+        cpu = time.process_time_ns() - self.cpu_start
+        self.stats = {
+                'last_move_time': wall,
+                'last_move_cpu_time': cpu,
+                'budget_nodes': self.used,
+                'wall_overrun': max(0, wall - self.wall) if self.wall is not None else 0,
+                'cpu_overrun': max(0, cpu - self.cpu) if self.cpu is not None else 0,
+                'node_overrun': max(0, self.used - self.nodes) if self.nodes is not None else 0,
+                }
+        return self.stats
+
+
+class TimeManager:
+    """Shares time between the moves of a game, giving more to critical
+    positions and less to easy ones.
+
+    Before each move, allocate sets the limit of the agent's budget to
+    mean scaled by the urgency of the position relative to the average
+    urgency of the moves so far. Since positions grow more urgent as a
+    game goes on, and searches overrun their limits, the limit is then
+    corrected by a payback-th of the time the game has spent above or
+    below mean per move, so that the game spends about mean per move in
+    total. Positions are more urgent with fewer empty cells, with
+    fewer legal moves and with larger tiles; a position with a single
+    legal move gets only min_limit. If mean is None, it is taken from the
+    budget's limit on the first move. If allowance is given, no move is
+    given more than share of what is left of it, so that a game, or a
+    series of games sharing the manager, stays within allowance. clock
+    names the budget limit that is set, 'wall' or 'cpu'."""
+
+    def __init__(self, mean=None, allowance=None, share=.05, min_limit=1e6,
+            payback=10, clock='wall'):
+        self.mean = mean
+        self.payback = payback
+        self.allowance = allowance
+        self.share = share
+        self.min_limit = min_limit
+        self.clock = clock
+        self.spent = 0
+        self.new_game()
+
+    def new_game(self):
+        """Resets the average urgency and time spent, for a new game."""
+        self.urgency_total = 0
+        self.moves = 0
+        self.game_spent = 0
+
+    @staticmethod
+    def urgency(grid):
+        """Returns how much time a move from grid deserves, relative to
+        other positions, or 0 if there is only one legal move."""
+        legal = bin(grid.get_move_mask()).count('1')
+        if legal <= 1:
+            return 0
+        empty = len(grid.get_available_cells())
+        urgency = 1 + max(0, 8 - empty) / 2
+        if legal == 2:
+            urgency *= 1.5
+        return urgency * (1 + int(grid.get_max_tile()).bit_length() / 16)
+
+    def allocate(self, grid, budget):
+        """Sets the limit of budget for a move from grid, and returns
+        it."""
+        if self.mean is None:
+            self.mean = getattr(budget, self.clock)
+            if self.mean is None:
+                raise ValueError(f'budget has no {self.clock} limit to manage')
+        urgency = self.urgency(grid)
+        self.urgency_total += urgency
+        self.moves += 1
+        if not urgency:
+            limit = 0
+        else:
+            limit = self.mean * urgency * self.moves / self.urgency_total
+            limit += (self.mean * (self.moves - 1) - self.game_spent) / self.payback
+        if self.allowance is not None:
+            limit = min(limit, self.share * max(0, self.allowance - self.spent))
+        limit = max(limit, self.min_limit)
+        setattr(budget, self.clock, limit)
+        return limit
+
+    def record(self, stats):
+        """Counts the time a move took against the allowance, given the
+        statistics returned by Budget.finish."""
+        spent = stats['last_move_time' if self.clock == 'wall' else 'last_move_cpu_time']
+        self.spent += spent
+        self.game_spent += spent
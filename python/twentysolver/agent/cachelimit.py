@@ -1,32 +1,75 @@
 from collections import namedtuple
 from enum import Enum, auto
-import threading
-import time
 
-from . import PlayerAI, record, count, INF, Node
+from . import (IterativeSearch, record, count, INF, Node, search_bounds, star1_cutoff,
+        star1_window, static_max)
+from .transposition import TranspositionTable, EXACT, LOWER, UPPER
 
 import twentysolver.heuristic as heuristic
 from twentysolver.heuristic import estimate, estimate_min
+from twentysolver.grid import transform_cell, transform_move
 
 
-frame_cache = {}
+def cache_key(grid, move, symmetric=False):
+    """Returns the cache key for a move from grid. When symmetric, the
+    eight rotations and reflections of a grid share a single key, with
+    the move mapped onto the canonical board."""
+    if not symmetric:
+        return grid, move
+    key, symmetry = grid.canonical()
+    if move is None:
+        return key, None
+    if isinstance(move, tuple):
+        return key, transform_cell(move, symmetry)
+    return key, transform_move(move, symmetry)
 
 
 class Frame:
-    __slots__ = ['grid', 'alpha', 'beta', 'i', 'queue', 'value', 'move']
+    __slots__ = ['grid', 'alpha', 'beta', 'i', 'queue', 'value', 'move', 'window',
+            'bounds', 'reduced', 'reducing', 'limit', 'sampled']
     init_value = None
     def __init__(self, grid, move=None, alpha=-INF, beta=INF, i=None):
         self.value = self.init_value
+        # turns by which this frame's search has been reduced, and whether
+        # its current child is being searched at reduced depth
+        self.reduced = 0
+        self.reducing = False
+        # number of children to search, if the frame is sampled, and
+        # whether the frame or any frame below it skipped cells
+        self.limit = None
+        self.sampled = False
         self.grid = grid
         self.move = move
         self.alpha = alpha
         self.beta = beta
         self.i = i
         self.queue = None
-
-    def expand(self):
-        """Fills the queue with possible successor frames, and sets
-        index to first element."""
+        self.window = None
+        # the (low, high) range of any value in the search
+        self.bounds = None
+
+    def key(self, symmetric=False):
+        """Returns the cache key for this frame, shared by its rotations
+        and reflections if symmetric."""
+        return cache_key(self.grid, self.move, symmetric)
+
+    def bound(self):
+        """Returns whether the value of this frame is EXACT, or a LOWER or
+        UPPER bound given the (alpha, beta) window it was searched with,
+        or None if it is only an estimate."""
+        return None
+
+    def resolved_by(self, entry):
+        """Returns True if a cached entry makes searching this frame
+        unnecessary within its current (alpha, beta) window."""
+        return (entry.bound == EXACT
+                or entry.bound == LOWER and entry.value >= self.beta
+                or entry.bound == UPPER and entry.value <= self.alpha)
+
+    def expand(self, cached):
+        """Fills the queue with possible successor frames, ordered by
+        cached, which returns the cached value of a frame or None, and
+        sets index to first element."""
         raise NotImplementedError
 
     def alphabeta(self):
@@ -37,6 +80,11 @@ class Frame:
     def __getitem__(self, i):
         return self.queue[i]
 
+    def child_window(self):
+        """Returns the (alpha, beta) window to search the current child
+        with."""
+        return self.alpha, self.beta
+
     def __lt__(self, other):
         try:
             return self.value < other.value
@@ -51,10 +99,10 @@ class MaxFrame(Frame):
             (heuristic.evaluate_monotonic, .25),
             ]
     init_value = -INF
-    def expand(self):
-        self.queue = [MinFrame(g, move=m) for m, g in self.grid.get_available_moves()]
+    def expand(self, cached):
+        self.queue = [MinFrame(g, move=m) for m, g in self.grid.iter_available_moves()]
         self.queue.sort(reverse=True,
-                key=lambda f: self.lookup(f))
+                key=lambda f: self.lookup(f, cached))
         self.i = -1
 
     def update(self, result):
@@ -75,9 +123,19 @@ class MaxFrame(Frame):
             return True
         return False
 
-    def lookup(self, frame):
-        if cached := frame_cache.get((tuple(frame.grid.tiles), frame.move)):
-            return cached
+    def key(self, symmetric=False):
+        return cache_key(self.grid, None, symmetric)
+
+    def bound(self):
+        if self.value >= self.beta:
+            return LOWER
+        if self.value <= self.window[0]:
+            return UPPER
+        return EXACT
+
+    def lookup(self, frame, cached):
+        if value := cached(frame):
+            return value
         return estimate(frame.grid, self.sort_weights)
 
 
@@ -92,12 +150,12 @@ class MinFrame(Frame):
             ]
     init_value = INF
 
-    def expand(self):
+    def expand(self, cached):
         e = 1.1 * estimate(self.grid, self.sort_weights)
         self.queue = [ExpectFrame(self.grid, c)
                 for c in self.grid.get_available_cells()]
         self.queue.sort(
-                key = lambda f: self.lookup(f))
+                key = lambda f: self.lookup(f, cached))
                 # key=lambda f: e + estimate_min(self.grid, f.move, self.min_sort_weights))
         self.i = -1
 
@@ -113,18 +171,30 @@ class MinFrame(Frame):
             return True
         return False
 
-    def lookup(self, frame):
-        if cached := frame_cache.get((tuple(frame.grid.tiles), frame.move)):
-            return cached
+    def bound(self):
+        if self.value <= self.alpha:
+            return UPPER
+        if self.value >= self.window[1]:
+            return LOWER
+        return EXACT
+
+    def lookup(self, frame, cached):
+        if value := cached(frame):
+            return value
         return estimate_min(frame.grid, frame.move, self.min_sort_weights)
 
 
 MoveProb = namedtuple('MoveProb', ('move', 'prob'))
 class ExpectFrame(Frame):
+    """Calculate expected value of move based on probability of outcomes.
+    Outcomes are searched with Star1 windows, so that an outcome which
+    fails high or low takes the whole frame out of its window; the frame
+    then returns the bound on its value that the remaining outcomes allow,
+    which the transposition table can store soundly."""
     moves = [MoveProb(2, .9), MoveProb(4, .1)]
     init_value = 0
 
-    def expand(self):
+    def expand(self, cached):
         self.queue = [MaxFrame(self.grid.insert_tile(self.move, v))
                 for v,_ in self.moves]
         self.i = -1
@@ -133,7 +203,22 @@ class ExpectFrame(Frame):
         value, _ = result
         self.value += value * self.moves[self.i].prob
 
-class CacheLimitMin(PlayerAI):
+    def alphabeta(self):
+        prob_left = sum(p for _, p in self.moves[self.i:])
+        if not prob_left:
+            return False
+        bound = star1_cutoff(self.alpha, self.beta, self.value, prob_left, self.bounds)
+        if bound is None:
+            return False
+        self.value = bound
+        return True
+
+    def child_window(self):
+        prob_left = sum(p for _, p in self.moves[self.i:])
+        return star1_window(self.alpha, self.beta, self.value, prob_left,
+                self.moves[self.i].prob, self.bounds)
+
+class CacheLimitMin(IterativeSearch):
     evaluate_weights = [
             (heuristic.evaluate_combination, .75),
             (heuristic.evaluate_empty, 2),
@@ -147,68 +232,124 @@ class CacheLimitMin(PlayerAI):
     min_sort_weights = [
             (heuristic.evaluate_monotonic_change, .25),
             ]
+    count_keys = IterativeSearch.count_keys + ('cache_cutoffs',)
+    uses_budget = True
 
-    def __init__(self, depth_limit=2, time_limit=2e8, **kwargs):
+    def __init__(self, depth_limit=2, time_limit=2e8, symmetric=False,
+            cache_size=2**18, cache=None, **kwargs):
         self.root = None
-        self.time_limit = time_limit / 1e9
-        frame_cache.clear()
-        super().__init__(depth_limit, **kwargs)
-
-    def set_over(self):
-        self.over = True
+        # cache may be a table shared with other processes, such as a
+        # SharedTranspositionTable
+        self.cache = cache if cache is not None else TranspositionTable(cache_size)
+        # whether the rotations and reflections of a grid share an entry
+        self.symmetric = symmetric
+        super().__init__(depth_limit, time_limit, **kwargs)
 
     def get_move(self, grid):
-        self.over = False
-        stime = time.process_time_ns()
-        timer = threading.Timer(self.time_limit, self.set_over)
-        timer.start()
+        self.start_budget(grid)
         depth_limit = 1
-        # resolutions = [4, 6, 8, None]
-        r = 0
-        val, move = -INF, None
-        self.counts = {'get_max_calls': 0}
+        val, move = None, None
+        self.new_move()
+        self.cache.new_search()
         while True:
-            v, m = self.search(grid, depth_limit)
-            if self.over:
+            v, m = self.search_iteration(grid, depth_limit, val)
+            if self.budget.over:
                 break
             val, move = v, m
             depth_limit += 1
-        timer.cancel()
         self.stats = {
-                'last_move_time': time.process_time_ns() - stime,
+                **self.finish_budget(),
                 'last_move_value': depth_limit,
+                'cache_cutoffs': self.counts['cache_cutoffs'],
+                **self.ordering_stats(),
+                **self.search_stats(),
+                **self.cache.counters(),
                 }
         if move is None:
-            return grid.get_available_moves()[0][0]
+            return next(grid.iter_available_moves())[0]
         return move
 
-    def search(self, grid, depth_limit):
-        stack = [MaxFrame(grid)]
+    def cached(self, frame):
+        """Returns the value cached for frame, or None."""
+        return self.cache.get(frame.key(self.symmetric))
+
+    def search(self, grid, depth_limit, alpha=-INF, beta=INF):
+        stack = [MaxFrame(grid, alpha=alpha, beta=beta)]
+        stack[0].bounds = search_bounds(grid, self.evaluate_weights, depth_limit)
         result = None, None
-        while stack and not self.over:
+        while stack and not self.budget.spend():
             frame = stack[-1]
             # check for cutoff
-            if isinstance(frame, MinFrame) and len(stack) > (3 * depth_limit) - 1:
+            if isinstance(frame, MinFrame) and len(stack) + 3 * frame.reduced > (3 * depth_limit) - 1:
                 result = estimate(frame.grid, self.evaluate_weights), frame.move
                 stack.pop()
                 continue
+            depth = depth_limit - (len(stack) - 1) // 3 - frame.reduced
             # handle return value (in-order) or expand queue (pre-order)
             if frame.i is not None:
+                if self.research(frame, result[0]):
+                    child = frame.queue[frame.i]
+                    child = frame.queue[frame.i] = MinFrame(child.grid, move=child.move)
+                    child.alpha, child.beta = frame.alpha, frame.beta
+                    child.bounds = frame.bounds
+                    child.reduced = frame.reduced
+                    stack.append(child)
+                    continue
+                value = frame.value
                 frame.update(result)
+                self.extend_cells(frame, frame.value < value)
             else:
-                frame.expand()
+                # return a cached result if it was searched deeply enough
+                # and its bound settles this frame's window
+                if len(stack) > 1 and not isinstance(frame, ExpectFrame):
+                    entry = self.cache.probe(frame.key(self.symmetric))
+                    # values searched deeper than this search may fall
+                    # outside its bounds, which Star1 relies on
+                    if (entry is not None and entry.depth >= depth
+                            and frame.bounds[0] <= entry.value <= frame.bounds[1]
+                            and frame.resolved_by(entry)):
+                        self.counts['cache_cutoffs'] += 1
+                        result = entry.value, frame.move
+                        stack.pop()
+                        continue
+                frame.window = frame.alpha, frame.beta
+                frame.expand(self.cached)
+                if self.ordering is not None and not isinstance(frame, ExpectFrame):
+                    self.ordering.order(frame.queue, len(stack) - 1)
+                if isinstance(frame, MinFrame):
+                    self.select_cells(frame, frame.queue)
 
             # append next child (in-order) or return value and pop frame (post-order)
             frame.i += 1
-            if frame.i == len(frame.queue) or frame.alphabeta():
+            # Star1 can prune a chance frame from the bounds alone, before
+            # its first outcome
+            cutoff = (frame.i > 0 or isinstance(frame, ExpectFrame)) and frame.alphabeta()
+            if cutoff:
+                self.count_cutoff(frame, len(stack) - 1, depth)
+            if frame.i == len(frame.queue) or frame.i == frame.limit or cutoff:
+                bound = frame.bound()
+                if frame.limit is not None:
+                    frame.sampled = True
+                if frame.sampled:
+                    # skipping cells can only miss lower values, so the
+                    # value is at most an upper bound, here and above
+                    bound = UPPER if bound in (EXACT, UPPER) else None
+                    if len(stack) > 1:
+                        stack[-2].sampled = True
+                self.cache.store(frame.key(self.symmetric), frame.value, depth, bound)
                 if isinstance(frame, MaxFrame):
-                    frame_cache[(tuple(frame.grid.tiles), None)] = frame.value
                     self.counts['get_max_calls'] += 1
-                else:
-                    frame_cache[(tuple(frame.grid.tiles), frame.move)] = frame.value
                 result = frame.value, frame.move
                 stack.pop()
                 continue
-            stack.append(frame[frame.i])
-            stack[-1].alpha, stack[-1].beta = frame.alpha, frame.beta
+            child = frame[frame.i]
+            if isinstance(frame, ExpectFrame) and self.static_four(frame, (len(stack) - 1) // 3):
+                result = static_max(child.grid, self.evaluate_weights), None
+                continue
+            child.alpha, child.beta = frame.child_window()
+            child.bounds = frame.bounds
+            child.reduced = frame.reduced
+            if isinstance(frame, MaxFrame):
+                self.reduce(frame, child, depth)
+            stack.append(child)
         return result
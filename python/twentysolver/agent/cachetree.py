@@ -1,26 +1,36 @@
 """An iterative deepening agent that caches results in a search tree."""
 
 from collections import namedtuple
-import threading
-import time
+
+import numpy as np
 
 from twentysolver import heuristic
-from twentysolver.heuristic import estimate, estimate_min
+from twentysolver.grid import DIRECTIONS, TILE_TYPE, move_batch
+from twentysolver.heuristic import estimate, estimate_batch, estimate_min
 
-from . import PlayerAI, INF
+from . import IterativeSearch, INF, search_bounds, star1_cutoff, star1_window, static_max
+from .transposition import EXACT
 
 frame_cache = {}
 
 
 class Frame:
     """Stack frame for storing search state for any given move (player or opponent)."""
-    __slots__ = ['_grid', 'alpha', 'beta', 'i', 'best_node']
-    def __init__(self, grid, alpha=-INF, beta=INF, i=None):
+    __slots__ = ['_grid', 'alpha', 'beta', 'i', 'best_node', 'bounds', 'reduced',
+            'reducing', 'limit', 'window']
+    def __init__(self, grid, alpha=-INF, beta=INF, i=None, bounds=None):
         self._grid = grid
+        # turns by which this frame's search has been reduced, and whether
+        # its current child is being searched at reduced depth
+        self.reduced = 0
+        self.reducing = False
+        # number of children to search, if the frame is sampled
+        self.limit = None
         self.alpha = alpha
         self.beta = beta
         self.i = i
         self.best_node = None
+        self.bounds = bounds
 
     def alphabeta(self):
         """Update bounds and prune branch if move is outside of
@@ -89,7 +99,7 @@ class MaxFrame(Frame):
     def expand(self):
         if self.children is None:
             self.children = [GridNode(g, m, estimate(g, self.sort_weights))
-                for m, g in self.grid.get_available_moves()]
+                for m, g in self.grid.iter_available_moves()]
         self.children.sort(reverse=True)
         self.i = -1
 
@@ -111,7 +121,7 @@ class MaxFrame(Frame):
 
     def __getitem__(self, index):
         return MinFrame(self.children[index],
-                alpha=self.alpha, beta=self.beta)
+                alpha=self.alpha, beta=self.beta, bounds=self.bounds)
 
 
 class MinFrame(Frame):
@@ -147,12 +157,15 @@ class MinFrame(Frame):
 
     def __getitem__(self, index):
         return ExpectFrame(self.children[index],
-                alpha=self.alpha, beta=self.beta)
+                alpha=self.alpha, beta=self.beta, bounds=self.bounds)
 
 
 MoveProb = namedtuple('MoveProb', ('move', 'prob'))
 class ExpectFrame(Frame):
-    """Calculate expected value of move based on probability of outcomes."""
+    """Calculate expected value of move based on probability of outcomes.
+    When the frame knows the bounds of the values in the search, it
+    prunes with Star1; otherwise it prunes after the first outcome if
+    that outcome alone, scaled up by its probability, is below alpha."""
     __slots__ = ['value']
     moves = [MoveProb(2, .9), MoveProb(4, .1)]
     def __init__(self, *args, **kwargs):
@@ -169,6 +182,16 @@ class ExpectFrame(Frame):
         self.value += result.value * self.moves[self.i].prob
 
     def alphabeta(self):
+        if self.bounds is not None:
+            prob_left = sum(p for _, p in self.moves[self.i:])
+            if not prob_left:
+                return False
+            bound = star1_cutoff(self.alpha, self.beta, self.value, prob_left, self.bounds)
+            if bound is None:
+                return False
+            # the bound the remaining outcomes allow, not the partial sum
+            self.value = bound
+            return True
         if self.i == 1 and self.value / self.moves[0].prob <= self.alpha:
             return True
         return False
@@ -178,8 +201,14 @@ class ExpectFrame(Frame):
         return self
 
     def __getitem__(self, index):
-        return MaxFrame(self.children[index],
-                alpha=self.alpha*self.moves[index].prob, beta=self.beta/self.moves[index].prob)
+        prob = self.moves[index].prob
+        if self.bounds is not None:
+            prob_left = sum(p for _, p in self.moves[index:])
+            alpha, beta = star1_window(self.alpha, self.beta, self.value,
+                    prob_left, prob, self.bounds)
+        else:
+            alpha, beta = self.alpha*prob, self.beta/prob
+        return MaxFrame(self.children[index], alpha=alpha, beta=beta, bounds=self.bounds)
 
 
 class GridNode:
@@ -220,87 +249,215 @@ class GridNode:
         except AttributeError:
             return self.value <= other
 
-class CacheTree(PlayerAI):
+class CacheTree(IterativeSearch):
     evaluate_weights = [
             (heuristic.evaluate_combination, .75),
             (heuristic.evaluate_empty, 2),
             (heuristic.evaluate_monotonic, .25),
             ]
-
-    def __init__(self, depth_limit=2, time_limit=1.9e8, **kwargs):
+    count_keys = IterativeSearch.count_keys + ('chance_nodes', 'batched_leaves',
+            'table_cutoffs')
+    uses_budget = True
+
+    def __init__(self, depth_limit=2, time_limit=1.9e8, star1=False,
+            batch_leaves=False, max_retained=2**18, ordering=False, table=None,
+            **kwargs):
+        if ordering:
+            # the tree orders children by their values from the last
+            # iteration already
+            raise ValueError('CacheTree does not take a move ordering')
         self.root = None
-        self.time_limit = time_limit / 1e9
+        # table may be a TranspositionTable, or a SharedTranspositionTable,
+        # of exact player values, which lets transpositions in the tree
+        # and searches in other processes share their results
+        self.table = table
+        self.max_retained = max_retained
+        self.reused_nodes = 0
+        self.star1 = star1
+        self.batch_leaves = batch_leaves
         frame_cache.clear()
-        super().__init__(depth_limit, **kwargs)
-
-    def set_over(self):
-        self.over = True
+        super().__init__(depth_limit, time_limit, **kwargs)
 
     def get_move(self, grid):
-        self.over = False
-        stime = time.time_ns()
-        timer = threading.Timer(self.time_limit, self.set_over)
-        timer.start()
+        self.start_budget(grid)
         root = self.find_root(grid)
         depth_limit = 1
         node = None
-        self.counts = {'get_max_calls': 0}
-        while True and not self.over:
-            n = self.search(root, depth_limit)
-            if self.over:
+        self.new_move()
+        if self.table is not None:
+            self.table.new_search()
+        while True and not self.budget.over:
+            n = self.search_iteration(root, depth_limit, node and node.value)
+            if self.budget.over:
                 break
             node = n
             depth_limit += 1
         self.root = node
-        timer.cancel()
         self.stats = {
-                'last_move_time': time.time_ns() - stime,
+                **self.finish_budget(),
                 'last_move_value': depth_limit -1,
+                'reused_nodes': self.reused_nodes,
+                'table_cutoffs': self.counts['table_cutoffs'],
+                **self.search_stats(),
                 # 'last_move_value': node.value if node else 0,
                 }
         if node is None:
-            return grid.get_available_moves()[0][0]
+            return next(grid.iter_available_moves())[0]
         return node.move
 
     def find_root(self, grid):
-        if self.root is not None and self.root.children is not None:
-            for node in self.root.children:
-                if (t := grid.get_cell_value(*node.move)) != 0:
-                    if node.children is None:
-                        break
-                    if t == 2:
-                        return node.children[0]
-                    else:
-                        return node.children[1]
+        """Returns the node for grid in the tree kept from the previous
+        move, matched on the board itself, or a new node if the opponent's
+        reply was never searched. The reused tree is trimmed to
+        max_retained nodes, and its size recorded in reused_nodes."""
+        self.reused_nodes = 0
+        if self.root is not None:
+            for cell in self.root.children or ():
+                for node in cell.children or ():
+                    if node.grid == grid:
+                        self.reused_nodes = self.trim(node)
+                        return node
         return GridNode(grid)
 
-    def search(self, root, depth_limit):
-        stack = [MaxFrame(root)]
+    def trim(self, root):
+        """Cuts whole levels from the bottom of the tree below root until
+        it holds at most max_retained nodes, and returns the number of
+        nodes kept."""
+        kept, level = 1, [root]
+        while level:
+            below = [child for node in level for child in node.children or ()]
+            if kept + len(below) > self.max_retained:
+                for node in level:
+                    node.children = None
+                break
+            kept += len(below)
+            level = below
+        return kept
+
+    def search_value(self, root, depth_limit, alpha, beta):
+        """Searches root within (alpha, beta), returning the value and
+        best node, or None for the value if the budget ran out."""
+        node = self.search(root, depth_limit, alpha, beta)
+        if self.budget.over or node is None:
+            return None, node
+        return node.value, node
+
+    def search(self, root, depth_limit, alpha=-INF, beta=INF):
+        bounds = None
+        if self.star1:
+            bounds = search_bounds(root.grid, self.evaluate_weights, depth_limit)
+        stack = [MaxFrame(root, alpha=alpha, beta=beta, bounds=bounds)]
         result = None
-        while stack and not self.over:
+        while stack and not self.budget.spend():
             frame = stack[-1]
             # check for cutoff
-            if isinstance(frame, MinFrame) and len(stack) > (3 * depth_limit) - 1:
+            ply = len(stack) + 3 * frame.reduced
+            if isinstance(frame, MinFrame) and ply > (3 * depth_limit) - 1:
                 result = frame.result(estimate(frame.grid, self.evaluate_weights))
                 stack.pop()
                 continue
+            # evaluate the whole frontier below the last opponent move at once
+            if (self.batch_leaves and frame.i is None and isinstance(frame, MinFrame)
+                    and ply == (3 * depth_limit) - 1):
+                result = frame.result(self.search_frontier(frame))
+                stack.pop()
+                continue
             # handle return value (in-order) or expand queue (pre-order)
             if frame.i is not None:
                 if isinstance(frame, MaxFrame):
                     self.counts['get_max_calls'] += 1
+                if self.research(frame, result.value):
+                    child = frame[frame.i]
+                    child.reduced = frame.reduced
+                    stack.append(child)
+                    continue
+                best_node = frame.best_node
                 frame.update(result)
+                self.extend_cells(frame, frame.best_node is not best_node)
             else:
+                if self.table is not None and isinstance(frame, MaxFrame) and len(stack) > 1:
+                    if self.probe(frame, depth_limit - (ply - 1) // 3):
+                        result = frame
+                        stack.pop()
+                        continue
+                    frame.window = frame.alpha, frame.beta
+                if isinstance(frame, ExpectFrame):
+                    self.counts['chance_nodes'] += 1
                 frame.expand()
+                if isinstance(frame, MinFrame):
+                    self.select_cells(frame, frame.children)
 
             # append next child (in-order) or return value and pop frame (post-order)
             frame.i += 1
-            if frame.i == len(frame.children) or frame.alphabeta():
+            if frame.i == len(frame.children) or frame.i == frame.limit or frame.alphabeta():
                 result = frame.result()
+                if self.table is not None and isinstance(frame, MaxFrame) and len(stack) > 1:
+                    self.store(frame, depth_limit - (ply - 1) // 3)
                 stack.pop()
                 continue
-            stack.append(frame[frame.i])
-        if not self.over:
+            child = frame[frame.i]
+            if isinstance(frame, ExpectFrame) and self.static_four(frame, (len(stack) - 1) // 3):
+                result = child.result(static_max(child.grid, self.evaluate_weights))
+                continue
+            child.reduced = frame.reduced
+            if isinstance(frame, MaxFrame):
+                self.reduce(frame, child, depth_limit - (ply - 1) // 3)
+            stack.append(child)
+        if not self.budget.over:
             return result.best_node
         if stack:
             return stack[0].best_node
         return None
+
+    def probe(self, frame, depth):
+        """Gives the player frame frame, with depth turns left, the value
+        stored in the table and returns True, if the table holds an exact
+        value searched at least as deep. Star1 searches also need the
+        value to lie within their bounds."""
+        entry = self.table.probe((frame.grid, None))
+        if entry is None or entry.bound != EXACT or entry.depth < depth:
+            return False
+        if frame.bounds is not None and not frame.bounds[0] <= entry.value <= frame.bounds[1]:
+            return False
+        frame.result(entry.value)
+        self.counts['table_cutoffs'] += 1
+        return True
+
+    def store(self, frame, depth):
+        """Stores the value of the player frame frame, searched with depth
+        turns left, if it is exact: strictly inside the window the frame
+        was searched with."""
+        alpha, beta = frame.window
+        if alpha < frame.value < beta:
+            self.table.store((frame.grid, None), frame.value, depth, EXACT)
+
+    def search_frontier(self, frame):
+        """Returns the value of a MinFrame whose grandchild MaxFrames are
+        at the depth limit, scoring every leaf below it with a single
+        call to estimate_batch. The frame's children are given their
+        expected values, which order them in the next iteration, and keep
+        any subtrees already below them, such as a reused tree. The
+        frontier is searched without pruning."""
+        grid = frame.grid
+        cells = grid.get_available_cells()
+        tiles = [t for t, _ in ExpectFrame.moves]
+        probs = np.array([p for _, p in ExpectFrame.moves])
+        boards = np.tile(np.asarray(grid.tiles, dtype=TILE_TYPE), (len(cells) * len(tiles), 1))
+        index = np.repeat([x + 4*y for x, y in cells], len(tiles))
+        boards[np.arange(len(boards)), index] = np.tile(tiles, len(cells))
+        moved, valid = zip(*(move_batch(boards, d) for d in DIRECTIONS))
+        scores = estimate_batch(np.concatenate(moved), self.evaluate_weights)
+        scores = np.where(np.concatenate(valid), scores, -INF)
+        values = (scores.reshape(len(DIRECTIONS), len(cells), len(tiles)).max(axis=0)
+                @ probs).tolist()
+        if frame.children is None:
+            frame.children = [GridNode(grid, c, v) for c, v in zip(cells, values)]
+        else:
+            cell_values = dict(zip(cells, values))
+            for child in frame.children:
+                child.value = cell_values[child.move]
+        self.counts['get_max_calls'] += len(boards)
+        self.counts['chance_nodes'] += len(cells)
+        self.counts['batched_leaves'] += len(moved) * len(boards)
+        self.budget.spend(len(boards))
+        return min(values, default=-INF)
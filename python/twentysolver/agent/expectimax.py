@@ -0,0 +1,99 @@
+"""An iterative deepening expectimax agent, which averages over tile
+placements rather than assuming the worst placement."""
+
+from twentysolver import heuristic
+from twentysolver.heuristic import estimate
+
+from . import PlayerAI, INF
+from .budget import Budget
+
+
+class Expectimax(PlayerAI):
+    """Searches player moves against the real tile distribution: every
+    empty cell is equally likely, and a new tile is a 2 with probability
+    .9 and a 4 with probability .1. Any branch whose cumulative
+    probability falls below prob_limit is estimated instead of searched,
+    so that the search time goes to likely futures. Deepening stops at
+    depth_limit turns, if it is given, or when the budget runs out."""
+    evaluate_weights = [
+            (heuristic.evaluate_combination, .75),
+            (heuristic.evaluate_empty, 2),
+            (heuristic.evaluate_monotonic, .25),
+            ]
+    tiles = [(2, .9), (4, .1)]
+    count_keys = ('get_max_calls', 'depth_cutoffs')
+    uses_budget = True
+
+    def __init__(self, depth_limit=None, time_limit=2e8, prob_limit=1e-4, budget=None,
+            **kwargs):
+        self.budget = budget if budget is not None else Budget(wall=time_limit)
+        self.prob_limit = prob_limit
+        self.cache = {}
+        super().__init__(depth_limit, **kwargs)
+
+    def get_move(self, grid):
+        self.start_budget(grid)
+        self.reset_counts()
+        depth_limit = 1
+        completed = 0
+        move = None
+        while True:
+            self.cache.clear()
+            self.counts['depth_cutoffs'] = 0
+            _, m = self.get_max(grid, 0, 1, depth_limit)
+            if self.budget.over:
+                break
+            move = m
+            completed = depth_limit
+            # every branch was cut off by probability, so searching
+            # deeper would give the same result
+            if not self.counts['depth_cutoffs']:
+                break
+            if self.depth_limit is not None and depth_limit >= self.depth_limit:
+                break
+            depth_limit += 1
+        self.stats = {
+                **self.finish_budget(),
+                'last_move_value': completed,
+                }
+        if move is None:
+            return next(grid.iter_available_moves())[0]
+        return move
+
+    def get_max(self, grid, depth, prob, depth_limit):
+        """Returns the value and move of the best player move from grid,
+        searching depth_limit turns from the root."""
+        self.counts['get_max_calls'] += 1
+        val, move = -INF, None
+        for m, g in grid.iter_available_moves():
+            if self.budget.spend():
+                break
+            v = self.get_chance(g, depth, prob, depth_limit)
+            if v > val:
+                val, move = v, m
+        return val, move
+
+    def get_chance(self, grid, depth, prob, depth_limit):
+        """Returns the expected value of grid over every tile the computer
+        could place, or its estimate if depth or probability are
+        exhausted."""
+        if depth >= depth_limit:
+            self.counts['depth_cutoffs'] += 1
+            return estimate(grid, self.evaluate_weights)
+        if prob < self.prob_limit:
+            return estimate(grid, self.evaluate_weights)
+        # a transposition reuses the value searched along the first path
+        # to reach it, whatever that path's probability
+        key = grid, depth
+        if key in self.cache:
+            return self.cache[key]
+        cells = grid.get_available_cells()
+        prob /= len(cells)
+        val = 0
+        for cell in cells:
+            for tile, p in self.tiles:
+                val += p * self.get_max(grid.insert_tile(cell, tile), depth + 1, prob * p,
+                        depth_limit)[0]
+        val /= len(cells)
+        self.cache[key] = val
+        return val
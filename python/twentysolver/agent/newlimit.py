@@ -1,9 +1,8 @@
 from collections import namedtuple
 from enum import Enum, auto
-import threading
-import time
 
-from . import PlayerAI, record, count, INF, Node
+from . import (IterativeSearch, record, count, INF, Node, search_bounds, star1_cutoff,
+        star1_window, static_max)
 
 import twentysolver.heuristic as heuristic
 from twentysolver.heuristic import estimate, estimate_min
@@ -18,16 +17,25 @@ class MoveType(Enum):
         return cls((self.val + n) % len(cls))
 
 class Frame:
-    __slots__ = ['grid', 'alpha', 'beta', 'i', 'queue', 'value', 'move']
+    __slots__ = ['grid', 'alpha', 'beta', 'i', 'queue', 'value', 'move',
+            'bounds', 'reduced', 'reducing', 'limit']
     init_value = None
     def __init__(self, grid, move=None, alpha=-INF, beta=INF, i=None):
         self.value = self.init_value
+        # turns by which this frame's search has been reduced, and whether
+        # its current child is being searched at reduced depth
+        self.reduced = 0
+        self.reducing = False
+        # number of children to search, if the frame is sampled
+        self.limit = None
         self.grid = grid
         self.move = move
         self.alpha = alpha
         self.beta = beta
         self.i = i
         self.queue = None
+        # the (low, high) range of any value in the search
+        self.bounds = None
 
     def expand(self):
         """Fills the queue with possible successor frames, and sets
@@ -42,6 +50,11 @@ class Frame:
     def __getitem__(self, i):
         return self.queue[i]
 
+    def child_window(self):
+        """Returns the (alpha, beta) window to search the current child
+        with."""
+        return self.alpha, self.beta
+
     def __lt__(self, other):
         try:
             return self.value < other.value
@@ -57,7 +70,7 @@ class MaxFrame(Frame):
             ]
     init_value = -INF
     def expand(self):
-        self.queue = [MinFrame(g, move=m) for m, g in self.grid.get_available_moves()]
+        self.queue = [MinFrame(g, move=m) for m, g in self.grid.iter_available_moves()]
         self.queue.sort(reverse=True,
                 key=lambda f: estimate(f.grid, self.sort_weights))
         self.i = -1
@@ -115,6 +128,10 @@ class MinFrame(Frame):
 
 MoveProb = namedtuple('MoveProb', ('move', 'prob'))
 class ExpectFrame(Frame):
+    """Calculate expected value of move based on probability of outcomes.
+    Outcomes are searched with Star1 windows, and the frame is pruned with
+    the bound on its value that the remaining outcomes allow once it
+    cannot end inside its window."""
     moves = [MoveProb(2, .9), MoveProb(4, .1)]
     init_value = 0
 
@@ -127,7 +144,22 @@ class ExpectFrame(Frame):
         value, _ = result
         self.value += value * self.moves[self.i].prob
 
-class NewLimitMin(PlayerAI):
+    def alphabeta(self):
+        prob_left = sum(p for _, p in self.moves[self.i:])
+        if not prob_left:
+            return False
+        bound = star1_cutoff(self.alpha, self.beta, self.value, prob_left, self.bounds)
+        if bound is None:
+            return False
+        self.value = bound
+        return True
+
+    def child_window(self):
+        prob_left = sum(p for _, p in self.moves[self.i:])
+        return star1_window(self.alpha, self.beta, self.value, prob_left,
+                self.moves[self.i].prob, self.bounds)
+
+class NewLimitMin(IterativeSearch):
     evaluate_weights = [
             (heuristic.evaluate_combination, .75),
             (heuristic.evaluate_empty, 2),
@@ -141,68 +173,90 @@ class NewLimitMin(PlayerAI):
     min_sort_weights = [
             (heuristic.evaluate_monotonic_change, .25),
             ]
+    uses_budget = True
 
     def __init__(self, depth_limit=2, time_limit=2e8, **kwargs):
         self.root = None
-        self.time_limit = time_limit / 1e9
-        super().__init__(depth_limit, **kwargs)
-
-    def set_over(self):
-        self.over = True
+        super().__init__(depth_limit, time_limit, **kwargs)
 
     def get_move(self, grid):
-        self.over = False
-        stime = time.process_time_ns()
-        timer = threading.Timer(self.time_limit, self.set_over)
-        timer.start()
+        self.start_budget(grid)
         depth_limit = 1
-        # resolutions = [4, 6, 8, None]
-        r = 0
-        val, move = -INF, None
-        self.counts = {'get_max_calls': 0}
+        val, move = None, None
+        self.new_move()
         while True:
-            v, m = self.search(grid, depth_limit)
-            if self.over:
+            v, m = self.search_iteration(grid, depth_limit, val)
+            if self.budget.over:
                 break
             val, move = v, m
             depth_limit += 1
-        timer.cancel()
         self.stats = {
-                'last_move_time': time.process_time_ns() - stime,
+                **self.finish_budget(),
                 'last_move_value': depth_limit,
+                **self.ordering_stats(),
+                **self.search_stats(),
                 }
         if move is None:
-            return grid.get_available_moves()[0]
+            return next(grid.iter_available_moves())[0]
         return move
 
-    def search(self, grid, depth_limit):
-        stack = [MaxFrame(grid)]
+    def search(self, grid, depth_limit, alpha=-INF, beta=INF):
+        stack = [MaxFrame(grid, alpha=alpha, beta=beta)]
+        stack[0].bounds = search_bounds(grid, self.evaluate_weights, depth_limit)
         result = None, None
-        while stack and not self.over:
+        while stack and not self.budget.spend():
             frame = stack[-1]
             # check for cutoff
-            if len(stack) > (3 * depth_limit) - 1 and isinstance(frame, MinFrame):
+            if isinstance(frame, MinFrame) and len(stack) + 3 * frame.reduced > (3 * depth_limit) - 1:
                 result = estimate(frame.grid, self.evaluate_weights), frame.move
                 stack.pop()
                 continue
+            depth = depth_limit - (len(stack) - 1) // 3 - frame.reduced
             # handle return value (in-order) or expand queue (pre-order)
             if frame.i is not None:
+                if self.research(frame, result[0]):
+                    child = frame.queue[frame.i]
+                    child = frame.queue[frame.i] = MinFrame(child.grid, move=child.move)
+                    child.alpha, child.beta = frame.alpha, frame.beta
+                    child.bounds = frame.bounds
+                    child.reduced = frame.reduced
+                    stack.append(child)
+                    continue
+                value = frame.value
                 frame.update(result)
+                self.extend_cells(frame, frame.value < value)
                 # if frame < value:
                 #     frame.value = value
                 # if isinstance(frame, MaxFrame):
                 #     frame.move = move
             else:
                 frame.expand()
+                if self.ordering is not None and not isinstance(frame, ExpectFrame):
+                    self.ordering.order(frame.queue, len(stack) - 1)
+                if isinstance(frame, MinFrame):
+                    self.select_cells(frame, frame.queue)
 
             # append next child (in-order) or return value and pop frame (post-order)
             frame.i += 1
-            if frame.i == len(frame.queue) or frame.alphabeta():
+            # Star1 can prune a chance frame from the bounds alone, before
+            # its first outcome
+            cutoff = (frame.i > 0 or isinstance(frame, ExpectFrame)) and frame.alphabeta()
+            if cutoff:
+                self.count_cutoff(frame, len(stack) - 1, depth)
+            if frame.i == len(frame.queue) or frame.i == frame.limit or cutoff:
                 if isinstance(frame, MaxFrame):
                     self.counts['get_max_calls'] += 1
                 result = frame.value, frame.move
                 stack.pop()
                 continue
-            stack.append(frame[frame.i])
-            stack[-1].alpha, stack[-1].beta = frame.alpha, frame.beta
+            child = frame[frame.i]
+            if isinstance(frame, ExpectFrame) and self.static_four(frame, (len(stack) - 1) // 3):
+                result = static_max(child.grid, self.evaluate_weights), None
+                continue
+            child.alpha, child.beta = frame.child_window()
+            child.bounds = frame.bounds
+            child.reduced = frame.reduced
+            if isinstance(frame, MaxFrame):
+                self.reduce(frame, child, depth)
+            stack.append(child)
         return result
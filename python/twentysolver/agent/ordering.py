@@ -0,0 +1,59 @@
+"""Move ordering from the cutoffs of earlier searches."""
+
+
+class MoveOrdering:
+    """History and killer tables for ordering the children of search
+    frames.
+
+    Whenever a child causes a cutoff, record credits its move (a
+    direction for a player frame, a cell for an opponent frame) in the
+    history table, by the square of the depth left below it, and makes it
+    a killer at its ply, keeping the two most recent killers per ply.
+    order then sorts a frame's children with the killers at its ply
+    first, then by history if history is set; the sort is stable, so
+    children that neither table knows keep the order they were given.
+    Tables are kept across iterations and moves; call new_search at
+    every move to halve the history, so that old cutoffs count for less.
+
+    Player moves are only reordered if player is set: the static
+    estimates already put the cutoff move first almost every time, and
+    history only displaces it."""
+
+    def __init__(self, killers=2, history=True, player=False):
+        self.killers_per_ply = killers
+        self.use_history = history
+        self.player = player
+        self.history = {}
+        self.killers = {}
+
+    def orders(self, ply):
+        """Returns True if children at ply are ordered by the tables."""
+        return ply % 3 == 1 or self.player and ply % 3 == 0
+
+    def order(self, children, ply, move=lambda child: child.move):
+        """Sorts children, a list of frames at ply, in place."""
+        if not self.orders(ply):
+            return
+        killers = self.killers.get(ply, ())
+        history = self.history if self.use_history else {}
+        def key(child):
+            m = move(child)
+            return m not in killers, -history.get((ply % 3, m), 0)
+        children.sort(key=key)
+
+    def record(self, ply, move, depth):
+        """Records a cutoff by move at ply, with depth left to search."""
+        if not self.orders(ply):
+            return
+        key = ply % 3, move
+        self.history[key] = self.history.get(key, 0) + depth * depth
+        killers = self.killers.setdefault(ply, [])
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[self.killers_per_ply:]
+
+    def new_search(self):
+        """Ages the history table, and forgets killers, which are only
+        meaningful at the plies of the last search."""
+        self.history = {key: value // 2 for key, value in self.history.items() if value > 1}
+        self.killers.clear()
@@ -0,0 +1,216 @@
+"""A CacheTree agent that splits each search across a pool of worker
+processes."""
+
+import itertools
+import multiprocessing
+import os
+import time
+
+from twentysolver import heuristic
+from twentysolver.grid import row_table, row_arrays
+
+from . import INF
+from .budget import Budget
+from .cachetree import CacheTree, GridNode, ExpectFrame
+from .transposition import SharedTranspositionTable
+
+# worker pools by number of processes
+_pools = {}
+_search_ids = itertools.count()
+_config_ids = itertools.count()
+
+def get_pool(processes):
+    """Returns the shared pool of processes workers, starting it on first
+    use. The pool lives for the rest of the program, so that every agent,
+    move and game with that many processes reuses the same workers."""
+    if processes not in _pools:
+        _pools[processes] = multiprocessing.Pool(processes, initializer=build_tables)
+    return _pools[processes]
+
+def shutdown_pool():
+    """Stops every shared worker pool that is running."""
+    while _pools:
+        _, pool = _pools.popitem()
+        pool.terminate()
+        pool.join()
+
+def build_tables():
+    """Builds the lookup tables up front, so that the first search after
+    starting a process does not pay for them."""
+    row_table()
+    row_arrays()
+    heuristic.line_tables()
+    heuristic.line_arrays()
+
+# per-process state of a worker: its agent and the configuration it was
+# built from, and the search trees of the units it has searched during
+# the current move
+_worker = None
+_worker_config = None
+_worker_search = None
+_worker_roots = {}
+
+def search_unit(args):
+    """Searches one unit of work in a worker process: the root of grid
+    restricted to move (or all moves, if move is None), to depth_limit,
+    stopping at the shared deadline. config is a (config id, options,
+    evaluate_weights, table) tuple, where table is the state of a
+    SharedTranspositionTable or None, and the worker's CacheTree is
+    rebuilt from it whenever the id changes. Returns the value of the root and the counters of the
+    search, or None if the deadline passed before the search finished."""
+    global _worker, _worker_config, _worker_search
+    search_id, grid, move, depth_limit, deadline, config = args
+    remaining = deadline - time.time()
+    if remaining <= 0:
+        return None
+    config_id, options, evaluate_weights, table = config
+    if config_id != _worker_config:
+        if _worker is not None and _worker.table is not None:
+            _worker.table.close()
+        if table is not None:
+            table = SharedTranspositionTable(*table)
+        _worker = CacheTree(table=table, **options)
+        _worker.evaluate_weights = evaluate_weights
+        _worker_config = config_id
+        _worker_search = None
+    if search_id != _worker_search:
+        _worker_roots.clear()
+        _worker_search = search_id
+    # a unit keeps its tree between iterations when the same worker gets it
+    key = grid, move
+    root = _worker_roots.get(key)
+    if root is None:
+        root = GridNode(grid)
+        if move is not None:
+            root.children = [GridNode(grid.move(move), move, 0)]
+        _worker_roots[key] = root
+    _worker.budget = Budget(wall=remaining * 1e9)
+    _worker.reset_counts()
+    node = _worker.search(root, depth_limit)
+    if _worker.budget.over:
+        return None
+    return (node.value if node is not None else -INF), _worker.counts
+
+
+class ParallelCacheTree(CacheTree):
+    """Runs the CacheTree search in parallel over a process pool.
+
+    Each depth of the iterative deepening is split into units, which the
+    pool searches independently against a deadline shared by every
+    worker. With split='moves' a unit is one root move. With
+    split='chance' a unit is one tile placement after one root move,
+    searched one turn shallower, which gives enough units to keep many
+    more than four workers busy. Units are searched with full windows,
+    so they lose the pruning between siblings that a serial search gets;
+    the results of a depth are only used once every unit has finished.
+    Workers search with the agent's options and evaluate_weights, but
+    share only the wall-clock limit of its budget. Aspiration windows and
+    max_retained are not supported, since units are searched with full
+    windows and workers do not keep their trees between moves.
+
+    table may be a SharedTranspositionTable, through which the workers
+    share the values of the positions they search. The caller creates it,
+    and unlinks it once the agent is done."""
+
+    def __init__(self, depth_limit=2, time_limit=1.9e8, star1=False,
+            processes=None, split=None, batch_leaves=False, aspiration=None,
+            max_retained=None, lmr=None, lmr_depth=2, sampling=None, four_depth=None,
+            table=None, **kwargs):
+        if table is not None and not isinstance(table, SharedTranspositionTable):
+            raise ValueError('parallel search needs a SharedTranspositionTable')
+        if aspiration is not None:
+            raise ValueError('parallel search does not support aspiration windows')
+        if max_retained is not None:
+            raise ValueError('parallel search does not retain trees between moves')
+        self.processes = processes or os.cpu_count()
+        if split is None:
+            split = 'moves' if self.processes <= 4 else 'chance'
+        if split not in ('moves', 'chance'):
+            raise ValueError(f'unknown split {split!r}')
+        self.split = split
+        super().__init__(depth_limit, time_limit, star1, batch_leaves, lmr=lmr,
+                lmr_depth=lmr_depth, sampling=sampling, four_depth=four_depth,
+                table=table, **kwargs)
+        if self.budget.wall is None:
+            raise ValueError('parallel search needs a wall-clock budget')
+        self.config = next(_config_ids), {
+                'star1': star1,
+                'batch_leaves': batch_leaves,
+                'lmr': lmr,
+                'lmr_depth': lmr_depth,
+                'sampling': self.sampling,
+                'four_depth': four_depth,
+                }, self.evaluate_weights, None if table is None else table.__getstate__()
+        build_tables()
+        get_pool(self.processes)
+
+    def get_move(self, grid):
+        self.start_budget(grid)
+        deadline = self.budget.deadline
+        pool = get_pool(self.processes)
+        search_id = next(_search_ids)
+        self.new_move()
+        if self.table is not None:
+            self.table.new_search()
+        moves = [m for m, _ in grid.iter_available_moves()]
+        units = self.units(grid, moves)
+        depth_limit = 1
+        move = None
+        while True:
+            result = pool.map_async(search_unit,
+                    [(search_id, g, m, depth_limit - offset, deadline, self.config)
+                        for g, m, offset in units], chunksize=1)
+            try:
+                values = result.get(max(0, deadline - time.time()))
+            except multiprocessing.TimeoutError:
+                break
+            if None in values:
+                break
+            for _, counts in values:
+                for key, n in counts.items():
+                    self.counts[key] += n
+            move = self.merge(moves, [value for value, _ in values])
+            depth_limit += 1
+        self.stats = {
+                **self.finish_budget(),
+                'last_move_value': depth_limit - 1,
+                'parallel_units': len(units),
+                'table_cutoffs': self.counts['table_cutoffs'],
+                **self.search_stats(),
+                }
+        if move is None:
+            return next(grid.iter_available_moves())[0]
+        return move
+
+    def units(self, grid, moves):
+        """Returns the units of work for a search from grid, as (grid,
+        move, depth offset) tuples. Chance units are ordered by move, then
+        cell, then tile, as merge expects them."""
+        if self.split == 'moves':
+            return [(grid, m, 0) for m in moves]
+        units = []
+        self.cells = []
+        for m in moves:
+            moved = grid.move(m)
+            cells = moved.get_available_cells()
+            self.cells.append(len(cells))
+            for cell in cells:
+                units.extend((moved.insert_tile(cell, t), None, 1)
+                        for t, _ in ExpectFrame.moves)
+        return units
+
+    def merge(self, moves, values):
+        """Returns the best of moves, given the values of the units
+        returned by units."""
+        if self.split == 'chance':
+            # a move is worth its worst cell, and a cell the expected
+            # value of its tiles
+            probs = [p for _, p in ExpectFrame.moves]
+            cells = [sum(p * v for p, v in zip(probs, values[i:i+len(probs)]))
+                    for i in range(0, len(values), len(probs))]
+            values, i = [], 0
+            for n in self.cells:
+                values.append(min(cells[i:i+n]))
+                i += n
+        best = max(range(len(moves)), key=lambda i: values[i])
+        return moves[best]
@@ -0,0 +1,43 @@
+"""Selective expansion of opponent frames with many empty cells."""
+
+import random
+
+
+class CellSampling:
+    """Chooses which cells of a wide opponent frame to search.
+
+    A frame with more than threshold empty cells searches only the first
+    cells of its children, which the engines rank most dangerous first by
+    evaluate_monotonic_change (or by cached values, where they have them),
+    plus sample more cells drawn at random from the rest. The opponent
+    places its tile on the worst cell for the player, so the value of a
+    sampled frame is an upper bound on the value of the full frame.
+
+    The random cells check the ranking: if one of them turns out worse
+    than every ranked cell, the ranking has missed a dangerous cell, and
+    the frame goes on to search all the cells it skipped. With sample=0
+    the ranking is trusted and a frame is never re-searched."""
+
+    def __init__(self, threshold=8, cells=4, sample=1, seed=None):
+        self.threshold = threshold
+        self.cells = cells
+        self.sample = sample
+        self.random = random.Random(seed)
+
+    def select(self, children):
+        """Moves the children to search to the front of children, a list
+        ranked most dangerous first, and returns how many to search, or
+        None if the frame is narrow enough to search them all."""
+        if len(children) <= max(self.threshold, self.cells + self.sample):
+            return None
+        rest = children[self.cells:]
+        drawn = set(self.random.sample(range(len(rest)), min(self.sample, len(rest))))
+        children[self.cells:] = ([c for i, c in enumerate(rest) if i in drawn]
+                + [c for i, c in enumerate(rest) if i not in drawn])
+        return self.cells + len(drawn)
+
+    def unrepresentative(self, i, improved):
+        """Returns True if the child searched at index i of a sampled frame
+        shows the ranking to be wrong, given whether it improved on (fell
+        below) the frame's value."""
+        return improved and i >= self.cells
@@ -0,0 +1,307 @@
+"""Fixed-capacity transposition tables for caching search results."""
+
+from collections import namedtuple
+from multiprocessing import shared_memory
+import struct
+
+import numpy as np
+
+# an entry's value is exact, or a bound from a search that failed high
+# (the true value is at least the stored value) or low (at most)
+EXACT, LOWER, UPPER = range(3)
+Entry = namedtuple('Entry', ('value', 'depth', 'bound'))
+
+
+def packed_key(key):
+    """Returns (board, code) for a key of a SharedTranspositionTable: a
+    packed board or grid, or a (board or grid, move) pair as the agents
+    use. The board is the grid packed into 64 bits, and code is 0 for no
+    move, 1 to 4 for a direction and 5 to 20 for a cell, so that both
+    are the same in every process."""
+    move = None
+    if isinstance(key, tuple):
+        key, move = key
+    board = key if isinstance(key, int) else key.board
+    if move is None:
+        code = 0
+    elif isinstance(move, tuple):
+        code = 5 + move[0] + 4*move[1]
+    else:
+        code = 1 + move
+    return board & 0xffffffffffffffff, code
+
+
+def mix(board, code):
+    """Returns a well-mixed 64-bit hash of a packed key (splitmix64)."""
+    h = (board ^ code * 0x9e3779b97f4a7c15) & 0xffffffffffffffff
+    h = ((h ^ (h >> 30)) * 0xbf58476d1ce4e5b9) & 0xffffffffffffffff
+    h = ((h ^ (h >> 27)) * 0x94d049bb133111eb) & 0xffffffffffffffff
+    return h ^ (h >> 31)
+
+
+class TranspositionTable:
+    """Cache of search results with a fixed number of entries.
+
+    Keys are hashed into buckets of two slots. The first slot of a bucket
+    is depth-preferred: it keeps the deepest entry stored during the
+    current search, and is only taken over by an entry searched to at
+    least the same depth, or when its own entry is left over from an
+    earlier search. The second slot is always replaced. Call new_search
+    at the start of every move, so that entries from earlier moves age
+    out first."""
+
+    def __init__(self, capacity=2**18):
+        self.buckets = max(1, capacity // 2)
+        size = 2 * self.buckets
+        self.hashes = [None] * size
+        self.keys = [None] * size
+        self.values = [None] * size
+        self.depths = [0] * size
+        self.bounds = [None] * size
+        self.ages = [0] * size
+        self.age = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def find(self, key):
+        """Returns the slot holding key, or None."""
+        h = hash(key)
+        i = 2 * (h % self.buckets)
+        if self.hashes[i] == h and self.keys[i] == key:
+            return i
+        if self.hashes[i+1] == h and self.keys[i+1] == key:
+            return i + 1
+        return None
+
+    def get(self, key, default=None):
+        """Returns the value stored for key, or default."""
+        i = self.find(key)
+        if i is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return self.values[i]
+
+    def probe(self, key):
+        """Returns the Entry stored for key, or None."""
+        i = self.find(key)
+        if i is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return Entry(self.values[i], self.depths[i], self.bounds[i])
+
+    def store(self, key, value, depth=0, bound=EXACT):
+        """Stores value for key, searched to depth, evicting an older or
+        shallower entry if the bucket is full. bound is one of EXACT,
+        LOWER or UPPER, or None for a value that is only an estimate."""
+        h = hash(key)
+        i = 2 * (h % self.buckets)
+        if self.hashes[i] == h and self.keys[i] == key:
+            pass
+        elif self.hashes[i+1] == h and self.keys[i+1] == key:
+            i += 1
+        elif self.keys[i] is None:
+            pass
+        elif self.ages[i] != self.age or depth >= self.depths[i]:
+            # demote the current occupant to the always-replace slot
+            if self.keys[i+1] is not None:
+                self.evictions += 1
+            self._set(i+1, self.hashes[i], self.keys[i], self.values[i],
+                    self.depths[i], self.bounds[i], self.ages[i])
+        else:
+            i += 1
+            if self.keys[i] is not None:
+                self.evictions += 1
+        self._set(i, h, key, value, depth, bound, self.age)
+
+    def _set(self, i, h, key, value, depth, bound, age):
+        self.hashes[i] = h
+        self.keys[i] = key
+        self.values[i] = value
+        self.depths[i] = depth
+        self.bounds[i] = bound
+        self.ages[i] = age
+
+    def new_search(self):
+        """Marks every stored entry as belonging to an earlier search."""
+        self.age += 1
+
+    def counters(self):
+        """Returns the hit, miss and eviction counts since the last call,
+        and resets them."""
+        counts = {
+                'cache_hits': self.hits,
+                'cache_misses': self.misses,
+                'cache_evictions': self.evictions,
+                }
+        self.hits = self.misses = self.evictions = 0
+        return counts
+
+    def clear(self):
+        """Removes every entry."""
+        self.__init__(2 * self.buckets)
+
+    def __len__(self):
+        return sum(key is not None for key in self.keys)
+
+
+class SharedTranspositionTable:
+    """Transposition table in shared memory, which any number of processes
+    can read and write at once without locks.
+
+    Keys are packed by packed_key into a board and a move code, which
+    are stored in full, so lookups are exact and do not depend on
+    Python's hashes. Each slot is a fixed-size record of three 64-bit
+    words: a check word, the value, and the move code, depth, bound and
+    age of the entry. The check word is the board xored with the other
+    two, so that a record torn by two processes writing at once fails its
+    check and reads as a miss. Slots are replaced as in
+    TranspositionTable.
+
+    A table is created with a capacity, and attached to in another
+    process by pickling it, or by passing its name. The process that
+    created it should unlink it when it is no longer needed."""
+    header = 8
+    occupied = 1 << 62
+    no_bound = 3
+
+    def __init__(self, capacity=2**18, name=None):
+        self.buckets = max(1, capacity // 2)
+        size = 2 * self.buckets
+        nbytes = 8 * (self.header + 3 * size)
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=nbytes)
+            self.shm.buf[:nbytes] = bytes(nbytes)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.ages = np.ndarray((self.header,), dtype=np.uint64, buffer=self.shm.buf)
+        self.slots = np.ndarray((size, 3), dtype=np.uint64, buffer=self.shm.buf,
+                offset=8 * self.header)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __getstate__(self):
+        return 2 * self.buckets, self.name
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    @property
+    def age(self):
+        return int(self.ages[0])
+
+    def _read(self, i, board, code):
+        """Returns the (value, depth, bound, age) record in slot i if it
+        holds the packed key (board, code), or None."""
+        check, value, meta = self.slots[i].tolist()
+        if not meta or check ^ value ^ meta != board or (meta >> 56) & 0x3f != code:
+            return None
+        bound = (meta >> 16) & 3
+        return (struct.unpack('<d', struct.pack('<Q', value))[0], meta & 0xffff,
+                None if bound == self.no_bound else bound, (meta >> 24) & 0xffffffff)
+
+    def _meta(self, i):
+        """Returns the ((board, code), depth, age) of slot i, or None if
+        it is empty."""
+        check, value, meta = self.slots[i].tolist()
+        if not meta:
+            return None
+        return ((check ^ value ^ meta, (meta >> 56) & 0x3f), meta & 0xffff,
+                (meta >> 24) & 0xffffffff)
+
+    def _bucket(self, key):
+        """Returns the packed key, and the first slot of its bucket."""
+        packed = packed_key(key)
+        return packed, 2 * (mix(*packed) % self.buckets)
+
+    def find(self, key):
+        """Returns the slot holding key, or None."""
+        packed, i = self._bucket(key)
+        for j in (i, i + 1):
+            if self._read(j, *packed) is not None:
+                return j
+        return None
+
+    def get(self, key, default=None):
+        """Returns the value stored for key, or default."""
+        entry = self.probe(key)
+        if entry is None:
+            return default
+        return entry.value
+
+    def probe(self, key):
+        """Returns the Entry stored for key, or None."""
+        packed, i = self._bucket(key)
+        for j in (i, i + 1):
+            if (record := self._read(j, *packed)) is not None:
+                self.hits += 1
+                return Entry(*record[:3])
+        self.misses += 1
+        return None
+
+    def store(self, key, value, depth=0, bound=EXACT):
+        """Stores value for key, searched to depth, evicting an older or
+        shallower entry if the bucket is full. bound is one of EXACT,
+        LOWER or UPPER, or None for a value that is only an estimate."""
+        packed, i = self._bucket(key)
+        first, second = self._meta(i), self._meta(i + 1)
+        age = self.age
+        if first is not None and first[0] == packed:
+            pass
+        elif second is not None and second[0] == packed:
+            i += 1
+        elif first is None:
+            pass
+        elif first[2] != age or depth >= first[1]:
+            # demote the current occupant to the always-replace slot
+            if second is not None:
+                self.evictions += 1
+            self.slots[i + 1] = self.slots[i]
+        else:
+            i += 1
+            if second is not None:
+                self.evictions += 1
+        self._set(i, packed, value, depth, bound, age)
+
+    def _set(self, i, packed, value, depth, bound, age):
+        board, code = packed
+        value = struct.unpack('<Q', struct.pack('<d', value))[0]
+        meta = (code << 56 | self.occupied | (age & 0xffffffff) << 24
+                | (self.no_bound if bound is None else bound) << 16
+                | min(max(depth, 0), 0xffff))
+        self.slots[i] = (board ^ value ^ meta, value, meta)
+
+    def new_search(self):
+        """Marks every stored entry as belonging to an earlier search."""
+        self.ages[0] = (self.age + 1) & 0xffffffff
+
+    def counters(self):
+        """Returns the hit, miss and eviction counts of this process since
+        the last call, and resets them."""
+        counts = {
+                'cache_hits': self.hits,
+                'cache_misses': self.misses,
+                'cache_evictions': self.evictions,
+                }
+        self.hits = self.misses = self.evictions = 0
+        return counts
+
+    def clear(self):
+        """Removes every entry."""
+        self.shm.buf[:] = bytes(len(self.shm.buf))
+
+    def close(self):
+        """Detaches this process from the table."""
+        del self.ages, self.slots
+        self.shm.close()
+
+    def unlink(self):
+        """Frees the shared memory, once every process has closed it."""
+        self.shm.unlink()
+
+    def __len__(self):
+        return int(np.count_nonzero(self.slots[:, 2]))
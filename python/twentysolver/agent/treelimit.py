@@ -1,6 +1,7 @@
 import time
 
 from . import PlayerAI, record, count, INF, Node
+from .sampling import CellSampling
 
 import twentysolver.heuristic as heuristic
 from twentysolver.heuristic import estimate, estimate_min
@@ -20,8 +21,10 @@ class PlayerAITreeLimitMin(PlayerAI):
             (heuristic.evaluate_monotonic_change, .25),
             ]
 
-    def __init__(self, depth_limit=2, **kwargs):
+    def __init__(self, depth_limit=2, sampling=None, **kwargs):
         self.root = None
+        # by default, search only the six most dangerous cells
+        self.sampling = sampling or CellSampling(threshold=6, cells=6, sample=0)
         super().__init__(depth_limit, **kwargs)
 
     @record
@@ -87,11 +90,16 @@ class PlayerAITreeLimitMin(PlayerAI):
                         for c in node.grid.get_available_cells()]
         node.available.sort()
         node.value = INF
+        limit = self.sampling.select(node.available)
         for i, n in enumerate(node.available):
-            if i > 5:
+            if i == limit:
+                # the tree is reused from move to move, so forget the
+                # skipped cells
                 node.available = node.available[:i]
                 break
             v = self.get_expect(n, alpha, beta, depth)
+            if limit is not None and self.sampling.unrepresentative(i, v < node.value):
+                limit = None
             if v < node.value:
                 node.value = v
                 if beta > v:
@@ -0,0 +1,88 @@
+"""Fixed-depth searches over a reference set of positions, for comparing
+search options by the work they do rather than by wall-clock time."""
+
+import time
+
+from twentysolver.grid import Grid
+from twentysolver.agent.budget import Budget
+from twentysolver.agent.cachetree import CacheTree, GridNode
+
+# early, middle and late game positions
+REFERENCE_GRIDS = [
+        [0, 0, 0, 0, 0, 0, 0, 0, 2, 0, 0, 0, 4, 4, 0, 0],
+        [0, 2, 0, 0, 0, 0, 4, 2, 0, 2, 8, 4, 2, 4, 16, 32],
+        [0, 2, 4, 8, 0, 0, 2, 16, 0, 0, 0, 32, 2, 0, 0, 64],
+        [2, 0, 0, 0, 4, 2, 0, 0, 16, 8, 4, 2, 128, 64, 32, 8],
+        [0, 0, 2, 4, 2, 4, 8, 16, 4, 16, 32, 64, 8, 64, 128, 512],
+        [2, 4, 2, 0, 8, 16, 4, 2, 32, 64, 128, 16, 1024, 512, 256, 4],
+        [0, 4, 8, 2, 2, 8, 32, 4, 8, 64, 128, 16, 4, 256, 1024, 2048],
+        ]
+
+def reference_grids(grid_type=Grid):
+    """Returns the reference positions as grids of grid_type."""
+    return [grid_type.from_list(tiles) for tiles in REFERENCE_GRIDS]
+
+def search(agent, grid, depth):
+    """Searches grid to a fixed depth with a CacheTree agent, returning
+    the best node and the agent's counters."""
+    agent.budget = Budget()
+    agent.reset_counts()
+    node = agent.search(GridNode(grid), depth)
+    return node, agent.counts
+
+def compare_chance_pruning(depth=3, grids=None):
+    """Counts the chance nodes searched by CacheTree on each reference
+    position, with its default chance-node pruning and with Star1.
+    Returns a list of (default, star1, same_move) tuples."""
+    results = []
+    for grid in grids or reference_grids():
+        default, default_counts = search(CacheTree(), grid, depth)
+        star1, star1_counts = search(CacheTree(star1=True), grid, depth)
+        results.append((default_counts['chance_nodes'], star1_counts['chance_nodes'],
+            default.move == star1.move))
+    return results
+
+def compare_leaf_batching(depth=3, grids=None):
+    """Times CacheTree on each reference position, evaluating leaves one
+    at a time and in batches. Returns a list of (default, batched,
+    same_move) tuples, with times in seconds of CPU time."""
+    results = []
+    for grid in grids or reference_grids():
+        times, nodes = [], []
+        for batch_leaves in (False, True):
+            stime = time.process_time()
+            node, _ = search(CacheTree(batch_leaves=batch_leaves), grid, depth)
+            times.append(time.process_time() - stime)
+            nodes.append(node)
+        results.append((*times, nodes[0].move == nodes[1].move))
+    return results
+
+def compare_four_tile_pruning(depth=3, four_depth=1, grids=None):
+    """Searches CacheTree on each reference position, searching every 4
+    tile and valuing those four_depth or more turns down statically.
+    Returns a list of (default, static, relative error, same_move) tuples,
+    counting nodes searched, with the error of the root value."""
+    results = []
+    for grid in grids or reference_grids():
+        default, static = CacheTree(), CacheTree(four_depth=four_depth)
+        default_node, _ = search(default, grid, depth)
+        static_node, _ = search(static, grid, depth)
+        error = abs(static_node.value - default_node.value) / max(1, abs(default_node.value))
+        results.append((default.budget.used, static.budget.used, error,
+            default_node.move == static_node.move))
+    return results
+
+def report(title, results):
+    """Prints a comparison, one reference position per line."""
+    print(title)
+    for result in results:
+        print(*result, sep='\t')
+    print('total', *(sum(r[i] for r in results) for i in range(2)), sep='\t')
+
+if __name__ == '__main__':
+    report('chance nodes searched (default, star1, same move)',
+            compare_chance_pruning())
+    report('seconds per search (default, batched leaves, same move)',
+            compare_leaf_batching())
+    report('nodes searched (default, static 4 tiles, value error, same move)',
+            compare_four_tile_pruning())
@@ -1,17 +1,22 @@
 """Game grid."""
 
+from collections import namedtuple
+
 import numpy as np
 
 DIRECTIONS = [RIGHT, DOWN, LEFT, UP] = range(4)
 TILE_TYPE=np.uint16
 
 class Grid:
-    __slots__ = ['tiles']
+    __slots__ = ['tiles', 'features', '_hash', '_canonical']
 
     def __init__(self, tiles=None):
         if tiles is None:
             tiles = np.zeros(16, dtype=TILE_TYPE)
         self.tiles = tiles
+        self.features = None
+        self._hash = None
+        self._canonical = None
 
     def get_cell_value(self, x, y):
         return self.tiles[x + 4*y]
@@ -22,27 +27,48 @@ class Grid:
     def get_available_cells(self):
         return [(x,y) for x in range(4) for y in range(4) if self.tiles[x+4*y] == 0]
 
+    def get_move_mask(self):
+        """Returns a bitmask of legal moves, with bit d set if moving in
+        direction d changes the grid. No grids are built."""
+        rows = pack_rows(self.tiles, ALL_DIRECTIONS)
+        legal = row_arrays().changed[rows].reshape(4, 4).any(axis=1).tolist()
+        return sum(1 << d for d in DIRECTIONS if legal[d])
+
+    def iter_available_moves(self):
+        """Lazily yields (move, grid) pairs for each legal move, only
+        building a grid when it is requested."""
+        mask = self.get_move_mask()
+        for d in DIRECTIONS:
+            if mask & (1 << d):
+                yield d, self.move(d)
+
     def get_available_moves(self):
-        grids = (self.move(d) for d in DIRECTIONS)
-        return [(move, grid) for move, grid in zip(DIRECTIONS, grids) if grid != self]
+        return list(self.iter_available_moves())
+
+    def get_lines(self):
+        """Returns the packed keys of the four rows, read left to right,
+        followed by the four columns, read top to bottom."""
+        return pack_rows(self.tiles, LINES).tolist()
 
     def validate_move(self, move):
         if move not in DIRECTIONS:
             raise Exception('Unrecognized move ' + str(move))
-        grid = self.move(move)
-        if grid == self:
+        if not self.get_move_mask() & (1 << move):
             raise Exception('Invalid move ' + str(move))
-        return grid
+        return self.move(move)
 
     def insert_tile(self, pos, tile):
         assert(self.tiles[pos[0] + pos[1]*4] == 0)
         tiles = np.array(self.tiles, dtype=TILE_TYPE)
         tiles[pos[0] + pos[1]*4] = tile
-        return Grid(tiles)
+        grid = Grid(tiles)
+        if self._hash is not None:
+            grid._hash = self._hash ^ ZOBRIST[pos[0] + pos[1]*4][EXPONENTS[tile]]
+        return grid
 
     def move(self, direction):
-        moved_rows = (move_row(row) for row in rol_row[direction](self.tiles))
-        return type(self)(ror_rows[direction](moved_rows))
+        rows = pack_rows(self.tiles, direction)
+        return type(self)(unpack_rows(row_arrays().result[rows], direction))
 
     def as_list(self):
         return self.tiles.tolist()
@@ -58,6 +84,34 @@ class Grid:
     def __eq__(self, other):
         return (self.tiles == other.tiles).all()
 
+    def __hash__(self):
+        """Zobrist hash of the grid, computed on first use and updated
+        incrementally by insert_tile."""
+        if self._hash is None:
+            h = 0
+            for keys, e in zip(ZOBRIST, EXPONENTS[self.tiles].tolist()):
+                h ^= keys[e]
+            self._hash = h
+        return self._hash
+
+    @property
+    def board(self):
+        """The grid packed into a 64-bit integer, as in BitGrid."""
+        return int((EXPONENTS[self.tiles].astype(np.uint64) << CELL_SHIFTS).sum(dtype=np.uint64))
+
+    def canonical(self):
+        """Returns (key, symmetry), where key is the smallest packed board
+        among the eight rotations and reflections of the grid, and
+        symmetry is the index of the transformation producing it. Moves
+        and cells are mapped between the two boards with transform_move
+        and transform_cell."""
+        if self._canonical is None:
+            exponents = EXPONENTS[self.tiles].astype(np.uint64)[SYMMETRY_SOURCES]
+            boards = (exponents << CELL_SHIFTS).sum(axis=1, dtype=np.uint64)
+            symmetry = int(boards.argmin())
+            self._canonical = int(boards[symmetry]), symmetry
+        return self._canonical
+
     def __repr__(self):
         return f'Grid({self.tiles!r})'
 
@@ -67,39 +121,303 @@ class Grid:
         return Grid(np.array(tiles, dtype=TILE_TYPE))
 
 
-def rol_row_0(tiles):
-    for i in range(0, 16, 4):
-        yield np.array(tiles[i:i+4])
+class BitGrid:
+    """Grid packed into a single 64-bit integer, with the base-2
+    exponent of each tile stored in 4 bits. Cell (x, y) occupies bits
+    4*(x + 4*y) through 4*(x + 4*y) + 3, so the board can be moved,
+    compared and hashed without touching numpy. Offers the same interface
+    as Grid."""
+    __slots__ = ['board', 'features']
+
+    def __init__(self, board=0):
+        self.board = board
+        self.features = None
+
+    def get_cell_value(self, x, y):
+        e = (self.board >> (4 * (x + 4*y))) & 0xF
+        return 1 << e if e else 0
+
+    def get_max_tile(self):
+        return max(self)
+
+    def get_available_cells(self):
+        board = self.board
+        return [(x,y) for x in range(4) for y in range(4)
+                if not (board >> (4 * (x + 4*y))) & 0xF]
+
+    def get_move_mask(self):
+        """Returns a bitmask of legal moves, with bit d set if moving in
+        direction d changes the grid. No grids are built."""
+        table = row_table()
+        board = self.board
+        columns = transpose(board)
+        mask = 0
+        for d, b, moved in ((RIGHT, board, table.result), (DOWN, columns, table.result),
+                (LEFT, board, table.reverse), (UP, columns, table.reverse)):
+            for shift in (0, 16, 32, 48):
+                row = (b >> shift) & 0xFFFF
+                if moved[row] != row:
+                    mask |= 1 << d
+                    break
+        return mask
+
+    def iter_available_moves(self):
+        """Lazily yields (move, grid) pairs for each legal move, only
+        building a grid when it is requested."""
+        mask = self.get_move_mask()
+        for d in DIRECTIONS:
+            if mask & (1 << d):
+                yield d, self.move(d)
+
+    def get_available_moves(self):
+        return list(self.iter_available_moves())
+
+    def get_lines(self):
+        """Returns the packed keys of the four rows, read left to right,
+        followed by the four columns, read top to bottom."""
+        board = self.board
+        columns = transpose(board)
+        return [board & 0xFFFF, (board >> 16) & 0xFFFF, (board >> 32) & 0xFFFF, board >> 48,
+                columns & 0xFFFF, (columns >> 16) & 0xFFFF, (columns >> 32) & 0xFFFF,
+                columns >> 48]
+
+    def validate_move(self, move):
+        if move not in DIRECTIONS:
+            raise Exception('Unrecognized move ' + str(move))
+        if not self.get_move_mask() & (1 << move):
+            raise Exception('Invalid move ' + str(move))
+        return self.move(move)
+
+    def insert_tile(self, pos, tile):
+        shift = 4 * (pos[0] + pos[1]*4)
+        assert(not (self.board >> shift) & 0xF)
+        return BitGrid(self.board | (tile.bit_length() - 1) << shift)
+
+    def move(self, direction):
+        table = row_table()
+        if direction in (LEFT, UP):
+            table = table.reverse
+        else:
+            table = table.result
+        if direction in (DOWN, UP):
+            board = transpose(self.board)
+        else:
+            board = self.board
+        moved = (table[board & 0xFFFF]
+                | table[(board >> 16) & 0xFFFF] << 16
+                | table[(board >> 32) & 0xFFFF] << 32
+                | table[board >> 48] << 48)
+        if direction in (DOWN, UP):
+            moved = transpose(moved)
+        return BitGrid(moved)
 
-def rol_row_1(tiles):
-    for i in reversed(range(0, 4)):
-        yield tiles[[i, i+4, i+8, i+12]]
+    def as_list(self):
+        return list(self)
 
-def rol_row_2(tiles):
-    for i in reversed(range(0, 16, 4)):
-        yield tiles[[i+3, i+2, i+1, i]]
+    @property
+    def tiles(self):
+        return self.as_list()
 
-def rol_row_3(tiles):
-    for i in range(0, 4):
-        yield tiles[[i+12, i+8, i+4, i]]
+    def __getitem__(self, i):
+        try:
+            x,y = i
+        except TypeError:
+            if not 0 <= i < 16:
+                raise IndexError(i)
+            e = (self.board >> (4*i)) & 0xF
+        else:
+            e = (self.board >> (4 * (x + 4*y))) & 0xF
+        return 1 << e if e else 0
 
-def ror_rows_0(rows):
-    return np.concatenate([r for r in rows])
+    def __eq__(self, other):
+        return self.board == other.board
 
-def ror_rows_1(rows):
-    moved = np.concatenate([r for r in rows])
-    return np.concatenate([moved[[i+12, i+8, i+4, i]] for i in range(4)])
+    def __hash__(self):
+        return hash(self.board)
 
-def ror_rows_2(rows):
-    moved = np.concatenate([r for r in rows])
-    return np.concatenate([moved[[i+3, i+2, i+1, i]] for i in reversed(range(0, 16, 4))])
+    def canonical(self):
+        """Returns (key, symmetry), where key is the smallest packed board
+        among the eight rotations and reflections of the grid, and
+        symmetry is the index of the transformation producing it."""
+        return min((b, t) for t, b in enumerate(symmetries(self.board)))
 
-def ror_rows_3(rows):
-    moved = np.concatenate([r for r in rows])
-    return np.concatenate([moved[[i, i+4, i+8, i+12]] for i in reversed(range(4))])
+    def __repr__(self):
+        return f'BitGrid({self.board:#018x})'
 
-rol_row = [rol_row_0, rol_row_1, rol_row_2, rol_row_3]
-ror_rows = [ror_rows_0, ror_rows_1, ror_rows_2, ror_rows_3]
+    @classmethod
+    def from_list(cls, tiles):
+        board = 0
+        for i, t in enumerate(tiles):
+            board |= (int(t).bit_length() - 1 if t else 0) << (4*i)
+        return cls(board)
+
+
+def transpose(board):
+    """Transpose a packed board, swapping cell (x, y) with cell (y, x)."""
+    a1 = board & 0xF0F00F0FF0F00F0F
+    a2 = board & 0x0000F0F00000F0F0
+    a3 = board & 0x0F0F00000F0F0000
+    a = a1 | (a2 << 12) | (a3 >> 12)
+    b1 = a & 0xFF00FF0000FF00FF
+    b2 = a & 0x00FF00FF00000000
+    b3 = a & 0x00000000FF00FF00
+    return b1 | (b2 >> 24) | (b3 << 24)
+
+def symmetries(board):
+    """Returns the eight rotations and reflections of a packed board.
+    Symmetry t mirrors the columns if bit 0 of t is set, mirrors the rows
+    if bit 1 is set, and then transposes the board if bit 2 is set."""
+    mirrored = ((board & 0x000F000F000F000F) << 12 | (board & 0x00F000F000F000F0) << 4
+            | (board & 0x0F000F000F000F00) >> 4 | (board & 0xF000F000F000F000) >> 12)
+    boards = [board, mirrored]
+    boards += [(b & 0xFFFF) << 48 | (b & 0xFFFF0000) << 16
+            | (b >> 16) & 0xFFFF0000 | b >> 48 for b in boards]
+    boards += [transpose(b) for b in boards]
+    return boards
+
+def transform_move(move, symmetry, inverse=False):
+    """Maps a move on a board to the equivalent move on its image under
+    symmetry, or back again if inverse is True."""
+    if inverse:
+        return SYMMETRY_MOVES[symmetry].index(move)
+    return SYMMETRY_MOVES[symmetry][move]
+
+def transform_cell(cell, symmetry, inverse=False):
+    """Maps an (x, y) cell of a board to the same cell of its image under
+    symmetry, or back again if inverse is True."""
+    x, y = cell
+    if inverse:
+        i = SYMMETRY_SOURCES[symmetry][x + 4*y]
+    else:
+        i = SYMMETRY_SOURCES[symmetry].tolist().index(x + 4*y)
+    return i % 4, i // 4
+
+def reverse_row(row):
+    """Reverse the order of the four tiles in a packed row."""
+    return ((row & 0xF) << 12 | (row & 0xF0) << 4
+            | (row & 0xF00) >> 4 | (row & 0xF000) >> 12)
+
+def slide_row(row):
+    """Slide a packed row of tile exponents towards its highest
+    position, as move_row does for a row of tile values, and return the
+    moved row with the value of any merged tiles. Two 32768 tiles
+    (exponent 15, the largest a nibble can hold) are left unmerged."""
+    exponents = [(row >> shift) & 0xF for shift in (12, 8, 4, 0)]
+    exponents = [e for e in exponents if e]
+    moved = []
+    score = 0
+    while exponents:
+        e = exponents.pop(0)
+        if exponents and exponents[0] == e and e < 0xF:
+            exponents.pop(0)
+            e += 1
+            score += 1 << e
+        moved.append(e)
+    result = 0
+    for shift, e in zip((12, 8, 4, 0), moved):
+        result |= e << shift
+    return result, score
+
+RowTable = namedtuple('RowTable', ('result', 'reverse', 'score', 'changed'))
+_row_table = None
+
+def row_table():
+    """Returns the outcome of sliding each of the 65536 possible packed
+    rows, building the table on first use. result[row] is the row slid
+    towards its highest position, reverse[row] the row slid towards its
+    lowest position, score[row] the value of tiles merged by result and
+    changed[row] whether result differs from row."""
+    global _row_table
+    if _row_table is None:
+        result, score = zip(*(slide_row(row) for row in range(0x10000)))
+        reverse = [reverse_row(result[reverse_row(row)]) for row in range(0x10000)]
+        changed = [moved != row for row, moved in enumerate(result)]
+        _row_table = RowTable(list(result), reverse, list(score), changed)
+    return _row_table
+
+_row_arrays = None
+
+def row_arrays():
+    """Returns row_table() as numpy arrays, for vectorized lookups."""
+    global _row_arrays
+    if _row_arrays is None:
+        table = row_table()
+        _row_arrays = RowTable(
+                np.array(table.result, dtype=np.uint16),
+                np.array(table.reverse, dtype=np.uint16),
+                np.array(table.score, dtype=np.uint32),
+                np.array(table.changed, dtype=np.bool_))
+    return _row_arrays
+
+# base-2 exponent of every possible tile value, and the inverse mapping
+EXPONENTS = np.zeros(0x10000, dtype=np.uint8)
+EXPONENTS[1 << np.arange(1, 16)] = np.arange(1, 16)
+POWERS = np.array([0] + [1 << e for e in range(1, 16)], dtype=TILE_TYPE)
+NIBBLE_SHIFTS = np.array([0, 4, 8, 12], dtype=np.uint16)
+
+# random key for every (cell, exponent) pair, with empty cells keyed 0
+ZOBRIST = [[0] + keys for keys in
+        np.random.default_rng(2048).integers(1, 2**62, (16, 15)).tolist()]
+
+# SYMMETRY_SOURCES[t][i] is the cell of the original board that symmetry t
+# moves to cell i; SYMMETRY_MOVES[t][d] is the image of direction d
+CELL_SHIFTS = np.arange(0, 64, 4, dtype=np.uint64)
+SYMMETRY_SOURCES = np.array([[(b >> (4*i)) & 0xF for i in range(16)]
+    for b in symmetries(sum(i << (4*i) for i in range(16)))])
+DIRECTION_OFFSETS = [1, 4, -1, -4]
+
+def _symmetry_moves(sources):
+    """Returns the image of each direction under a symmetry, found by
+    following the neighbours of cell (1, 1)."""
+    image = {cell: i for i, cell in enumerate(sources)}
+    return [DIRECTION_OFFSETS.index(image[5 + DIRECTION_OFFSETS[d]] - image[5])
+            for d in DIRECTIONS]
+
+SYMMETRY_MOVES = [_symmetry_moves(sources) for sources in SYMMETRY_SOURCES.tolist()]
+
+# cell indices of each row as seen by move_row, for every direction
+ROW_INDICES = [
+        np.array([[i, i+1, i+2, i+3] for i in range(0, 16, 4)]),
+        np.array([[i, i+4, i+8, i+12] for i in range(4)]),
+        np.array([[i+3, i+2, i+1, i] for i in range(0, 16, 4)]),
+        np.array([[i+12, i+8, i+4, i] for i in range(4)]),
+        ]
+# the rows of all four directions at once, in direction order
+ALL_DIRECTIONS = len(ROW_INDICES)
+ROW_INDICES.append(np.concatenate(ROW_INDICES))
+# the four rows followed by the four columns, read left to right and top
+# to bottom
+LINES = len(ROW_INDICES)
+ROW_INDICES.append(np.concatenate([ROW_INDICES[RIGHT], ROW_INDICES[DOWN]]))
+
+def pack_rows(tiles, direction):
+    """Pack the rows of an array of tile values into 16-bit row keys
+    for the given direction."""
+    exponents = EXPONENTS[tiles[..., ROW_INDICES[direction]]].astype(np.uint16)
+    return (exponents << NIBBLE_SHIFTS).sum(axis=-1, dtype=np.uint16)
+
+def unpack_rows(rows, direction):
+    """Inverse of pack_rows."""
+    exponents = (rows[..., None] >> NIBBLE_SHIFTS) & 0xF
+    tiles = np.empty(rows.shape[:-1] + (16,), dtype=TILE_TYPE)
+    tiles[..., ROW_INDICES[direction]] = POWERS[exponents]
+    return tiles
+
+def move_batch(boards, direction):
+    """Move an (N,16) array of boards in the given direction. Returns
+    the (N,16) array of moved boards and a boolean array marking which
+    boards were changed by the move."""
+    boards = np.asarray(boards, dtype=TILE_TYPE)
+    rows = pack_rows(boards, direction)
+    valid = row_arrays().changed[rows].any(axis=-1)
+    return unpack_rows(row_arrays().result[rows], direction), valid
+
+def available_moves_batch(boards):
+    """Returns an (N,4) boolean array marking the legal moves of an
+    (N,16) array of boards, indexed by direction."""
+    boards = np.asarray(boards, dtype=TILE_TYPE)
+    changed = row_arrays().changed[pack_rows(boards, ALL_DIRECTIONS)]
+    return changed.reshape(changed.shape[:-1] + (4, 4)).any(axis=-1)
 
 def move_row(row):
     target = 3
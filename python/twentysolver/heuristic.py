@@ -1,3 +1,10 @@
+from collections import namedtuple
+
+import numpy as np
+
+from twentysolver.grid import Grid, LINES, TILE_TYPE, RIGHT, LEFT, UP, pack_rows,\
+        row_table, transpose
+
 def evaluate_max(grid):
     return max(grid)
 
@@ -73,7 +80,63 @@ def evaluate_monotonic_change(grid, pos):
     return h
 
 def estimate(grid, weights):
-    return sum(w * f(grid) for f,w in weights)
+    """Returns the weighted sum of the feature functions in weights.
+    Functions in FEATURES are read from the grid's cached feature
+    vector; any others are called on the grid."""
+    values = features(grid).values
+    h = 0
+    for f, w in weights:
+        i = feature_index.get(f)
+        h += w * (f(grid) if i is None else values[i])
+    return h
+
+def estimate_bounds(grid, weights, turns):
+    """Returns (low, high) bounds on estimate(g, weights) for any grid g
+    reachable from grid within the given number of turns. Each turn adds
+    at most 4 to the sum of the tiles, which bounds every built-in
+    feature; any other feature is unbounded."""
+    total = sum(int(t) for t in grid) + 4 * turns
+    combination = total * (total.bit_length() - 2)
+    ranges = {
+            evaluate_combination: (0, combination),
+            evaluate_empty: (-8, 8),
+            evaluate_monotonic: (0, 2 * combination),
+            evaluate_max: (0, total),
+            }
+    low, high = 0, 0
+    for f, w in weights:
+        f_low, f_high = ranges.get(f, (-float('inf'), float('inf')))
+        if w < 0:
+            f_low, f_high = f_high, f_low
+        low += w * f_low
+        high += w * f_high
+    return low, high
+
+def estimate_batch(boards, weights):
+    """Returns the weighted sum of the feature functions in weights for
+    each board of an (N,16) array of tile values, as an array of N
+    scores. Features with an entry in batch_features are evaluated for
+    all boards at once; any others are called on one grid at a time."""
+    boards = np.asarray(boards, dtype=TILE_TYPE)
+    lines = pack_rows(boards, LINES)
+    h = np.zeros(len(boards))
+    for f, w in weights:
+        if f in batch_features:
+            h += w * batch_features[f](boards, lines)
+        else:
+            h += w * np.array([f(Grid(board)) for board in boards])
+    return h
+
+def batch_feature(batch):
+    """Decorator registering batch as the vectorized implementation of a
+    feature function, for use by estimate_batch. batch is called as
+    batch(boards, lines), where boards is an (N,16) array of tile values
+    and lines the (N,8) array of their packed row and column keys (see
+    Grid.get_lines), and returns an array of N feature values."""
+    def register(f):
+        batch_features[f] = batch
+        return f
+    return register
 
 def estimate_min(grid, tile, weights):
     return sum(w * f(grid, tile) for f,w in weights)
@@ -82,5 +145,140 @@ tile_values = {0: 0, 2: 0}
 
 def tile_value(tile):
     if tile not in tile_values:
-        tile_values[tile] = 2 * tile_values[tile >> 1] + tile
+        tile_values[tile] = 2 * tile_value(tile >> 1) + int(tile)
     return tile_values[tile]
+
+LineTables = namedtuple('LineTables', ('combination', 'empty', 'monotonic', 'max'))
+_line_arrays = None
+_line_tables = None
+
+def line_arrays():
+    """Returns per-line feature scores for each of the 65536 packed rows
+    of tile exponents (see grid.get_lines), as numpy arrays. Built on
+    first use."""
+    global _line_arrays
+    if _line_arrays is None:
+        lines = np.arange(0x10000)
+        exponents = (lines[:, None] >> np.array([0, 4, 8, 12])) & 0xF
+        tiles = np.where(exponents > 0, 1 << exponents, 0)
+        values = np.where(exponents > 0, (exponents - 1) << exponents, 0)
+        increasing = np.ones(len(lines), dtype=np.bool_)
+        decreasing = np.ones(len(lines), dtype=np.bool_)
+        for x in range(1, 4):
+            occupied = tiles[:, x] > 0
+            increasing &= ~occupied | (tiles[:, x] >= tiles[:, x-1])
+            decreasing &= ~occupied | (tiles[:, x] <= tiles[:, x-1])
+        _line_arrays = LineTables(
+                values.sum(axis=1),
+                (exponents == 0).sum(axis=1),
+                np.where(increasing | decreasing, values[:, 1:].sum(axis=1), 0),
+                tiles.max(axis=1))
+    return _line_arrays
+
+def line_tables():
+    """Returns line_arrays() as lists, for fast scalar lookups."""
+    global _line_tables
+    if _line_tables is None:
+        _line_tables = LineTables(*(a.tolist() for a in line_arrays()))
+    return _line_tables
+
+def batch_combination(boards, lines):
+    return line_arrays().combination[lines[:, :4]].sum(axis=1)
+
+def batch_empty(boards, lines):
+    return (boards == 0).sum(axis=1) - 8
+
+def batch_monotonic(boards, lines):
+    return line_arrays().monotonic[lines].sum(axis=1)
+
+def batch_max(boards, lines):
+    return boards.max(axis=1)
+
+# vectorized implementations of feature functions, taking an array of
+# boards and their line keys
+batch_features = {
+        evaluate_combination: batch_combination,
+        evaluate_empty: batch_empty,
+        evaluate_monotonic: batch_monotonic,
+        evaluate_max: batch_max,
+        }
+
+# features tracked by feature vectors, in vector order
+FEATURES = (evaluate_combination, evaluate_empty, evaluate_monotonic, evaluate_max)
+Features = namedtuple('Features', ('lines', 'values'))
+
+def line_feature_vector(lines):
+    """Returns the Features of a grid from its line keys, with the
+    value of every function in FEATURES."""
+    combination, empty, monotonic, maximum = line_tables()
+    r0, r1, r2, r3, c0, c1, c2, c3 = lines
+    return Features(lines, [
+        combination[r0] + combination[r1] + combination[r2] + combination[r3],
+        empty[r0] + empty[r1] + empty[r2] + empty[r3] - 8,
+        (monotonic[r0] + monotonic[r1] + monotonic[r2] + monotonic[r3]
+            + monotonic[c0] + monotonic[c1] + monotonic[c2] + monotonic[c3]),
+        max(maximum[r0], maximum[r1], maximum[r2], maximum[r3])])
+
+def insert_feature_vector(features, pos, tile):
+    """Returns the Features of a grid after tile is inserted at pos,
+    updating only the row and column containing pos."""
+    t = line_tables()
+    x, y = pos
+    e = int(tile).bit_length() - 1
+    lines = list(features.lines)
+    combination, empty, monotonic, maximum = features.values
+    row, column = lines[y], lines[4 + x]
+    lines[y] = row | e << (4*x)
+    lines[4 + x] = column | e << (4*y)
+    combination += t.combination[lines[y]] - t.combination[row]
+    empty += t.empty[lines[y]] - t.empty[row]
+    monotonic += (t.monotonic[lines[y]] - t.monotonic[row]
+            + t.monotonic[lines[4 + x]] - t.monotonic[column])
+    return Features(lines, [combination, empty, monotonic, max(maximum, tile)])
+
+def move_feature_vector(features, direction):
+    """Returns the Features of a grid after a move in direction, sliding
+    the line keys through the row table and only rescoring the lines
+    that changed."""
+    t = line_tables()
+    table = row_table()
+    moved = table.reverse if direction in (LEFT, UP) else table.result
+    if direction in (RIGHT, LEFT):
+        rows = [moved[r] for r in features.lines[:4]]
+        columns = _lines_of(transpose(_board_of(rows)))
+    else:
+        columns = [moved[c] for c in features.lines[4:]]
+        rows = _lines_of(transpose(_board_of(columns)))
+    lines = rows + columns
+    combination, empty, monotonic, maximum = features.values
+    for old, new in zip(features.lines[:4], rows):
+        if old != new:
+            combination += t.combination[new] - t.combination[old]
+            empty += t.empty[new] - t.empty[old]
+            maximum = max(maximum, t.max[new])
+    for old, new in zip(features.lines, lines):
+        if old != new:
+            monotonic += t.monotonic[new] - t.monotonic[old]
+    return Features(lines, [combination, empty, monotonic, maximum])
+
+feature_index = {f: i for i, f in enumerate(FEATURES)}
+
+def estimate_vector(features, weights):
+    """Returns the weighted sum of a Features vector. Every function in
+    weights must be one of FEATURES."""
+    values = features.values
+    return sum(w * values[feature_index[f]] for f, w in weights)
+
+def features(grid):
+    """Returns the Features vector of grid, computing every feature in a
+    single pass over its lines and caching the result on the grid. Any
+    set of weights can then be applied with estimate_vector."""
+    if grid.features is None:
+        grid.features = line_feature_vector(grid.get_lines())
+    return grid.features
+
+def _board_of(lines):
+    return lines[0] | lines[1] << 16 | lines[2] << 32 | lines[3] << 48
+
+def _lines_of(board):
+    return [board & 0xFFFF, (board >> 16) & 0xFFFF, (board >> 32) & 0xFFFF, board >> 48]
@@ -7,10 +7,11 @@ import subprocess
 
 import numpy as np
 
-from twentysolver.grid import Grid
+from twentysolver.grid import Grid, BitGrid
 import twentysolver.player_agent
 import twentysolver.agent
 from twentysolver.agent import CacheTree
+from twentysolver.agent.budget import TimeManager
 from twentysolver.display import CursesDisplayer
 
 class Player:
@@ -42,9 +43,9 @@ def random_tile():
     """Returns a random tile value of 2 or 4."""
     return 2 if random() < .9 else 4
 
-def play_game(player, opponent, displayer=None, screenshot=False):
+def play_game(player, opponent, displayer=None, screenshot=False, grid_type=Grid):
     """Play a single game and return a dictionary of statistics."""
-    grid = Grid()
+    grid = grid_type()
 
     for _ in range(2):
         pos = choice(grid.get_available_cells())
@@ -64,7 +65,7 @@ def play_game(player, opponent, displayer=None, screenshot=False):
         input = displayer.getch()
         if input == ord('q'):
             return None
-        if not grid.get_available_moves():
+        if not grid.get_move_mask():
             break
         move = player.get_move(grid)
         grid = grid.validate_move(move)
@@ -88,18 +89,25 @@ def play_game(player, opponent, displayer=None, screenshot=False):
             'score': grid.get_max_tile(),
             }
 
-def play_series(displayer, n=20, agent=None, screenshot=False):
+def play_series(displayer, n=20, agent=None, screenshot=False, grid_type=Grid,
+        adaptive_time=False):
     """Play a series of games, calculating the confidence interval for
     median and percentiles, stopping after a sufficiently high
-    confidence is reached."""
+    confidence is reached. With adaptive_time, each game is given a
+    TimeManager to share its time between moves, which needs an agent
+    that searches to a Budget."""
     games = []
     generator = np.random.default_rng()
     med, confidence = 0, 0
     if agent is None:
         agent = CacheTree
+    if adaptive_time and not getattr(agent, 'uses_budget', False):
+        raise ValueError(f'{agent.__name__} does not search to a time budget, '
+                'so it cannot use adaptive time')
     while confidence < .95:
-        player = agent()
-        stats = play_game(player, Computer(), displayer, screenshot=screenshot)
+        player = agent(time_manager=TimeManager()) if adaptive_time else agent()
+        stats = play_game(player, Computer(), displayer, screenshot=screenshot,
+                grid_type=grid_type)
         if stats is None:
             break
         games.append(stats)
@@ -161,7 +169,15 @@ def parseargs():
             help='[DEVELOPER OPTION] store a screenshot of the console after every move')
     parser.add_argument('--list-agents', action='store_true',
             help='list available agents and exit')
-    return vars(parser.parse_args())
+    parser.add_argument('--bitboard', action='store_true',
+            help='represent the board as a packed 64-bit integer')
+    parser.add_argument('--adaptive-time', action='store_true',
+            help='give critical positions more time, keeping the average per move')
+    args = parser.parse_args()
+    if args.adaptive_time and not getattr(args.agent or CacheTree, 'uses_budget', False):
+        parser.error(f'agent {args.agent.__name__} does not search to a time budget, '
+                'so it cannot use --adaptive-time')
+    return vars(args)
 
 def select_agent(agent):
     """Select agent based on class-name."""
@@ -180,11 +196,13 @@ def list_agents():
     #     if callable(getattr(obj, 'get_move', None))))
 
 
-def main(stdscr, screenshot=False, **kwargs):
+def main(stdscr, screenshot=False, bitboard=False, adaptive_time=False, **kwargs):
     """Main program loop."""
     displayer = CursesDisplayer(stdscr)
     agent = kwargs['agent']
-    play_series(displayer, agent=agent, screenshot=screenshot)
+    grid_type = BitGrid if bitboard else Grid
+    play_series(displayer, agent=agent, screenshot=screenshot, grid_type=grid_type,
+            adaptive_time=adaptive_time)
     displayer.wait()
 
 def get_win_id():